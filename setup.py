@@ -39,7 +39,7 @@ setup(
             "slidescore=slidescore_api.cli:cli",
         ],
     },
-    install_requires=["requests", "tqdm==4.45.0", "Pillow", "Shapely", "numpy"],
+    install_requires=["requests", "tqdm==4.45.0", "Pillow", "Shapely>=2.0", "numpy"],
     extras_require={
         "dev": [
             "pytest",
@@ -2,22 +2,47 @@
 # Copyright (c) slidescore_api contributors
 """Main module containing the SlideScore API wrapper."""
 
+import email.message
+import email.utils
 import io
 import json
 import logging
+import os
 import pathlib
 import re
 import shutil
 import sys
 import urllib.parse
-from typing import Dict, Iterable, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import requests
 from PIL import Image
 from requests import Response
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from tqdm.utils import CallbackIOWrapper
+from urllib3.util.retry import Retry
 
-type_to_name = [
+# NumPy is only needed for the array outputs, so it is imported when those are requested to speed up the CLI startup.
+if TYPE_CHECKING:
+    import numpy as np
+
+# Size of the chunks in which slides are streamed to disk.
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Default number of connections to the server which are kept open for reuse.
+DEFAULT_MAX_CONNECTIONS = 20
+
+_FILENAME_REGEX = re.compile(r"filename\*?=([^;]+)", flags=re.IGNORECASE)
+
+# Start of the range in the Content-Range header of a partial response, e.g. "bytes 100-999/1000".
+_CONTENT_RANGE_REGEX = re.compile(r"\s*bytes\s+(\d+)-", flags=re.IGNORECASE)
+
+# Sentinel for lazily computed attributes which have not been computed yet.
+_UNPARSED: Any = object()
+
+TYPE_TO_NAME: Tuple[str, ...] = (
     "FreeText",
     "Integer",
     "Real",
@@ -38,13 +63,43 @@ type_to_name = [
     "AnnoPoints",
     "AnnoMeasure",
     "AnnoShapes",
-]
+)
+NAME_TO_TYPE: Dict[str, int] = {name: idx for idx, name in enumerate(TYPE_TO_NAME)}
+# Kept for backwards compatibility.
+type_to_name = TYPE_TO_NAME
+
+
+def _parse_json(response: Response) -> Any:
+    """Decode a JSON response body directly from bytes, skipping the character set detection of `response.json`."""
+    return json.loads(response.content)
+
+
+def _as_int(value: Any) -> Optional[int]:
+    """Cast to int, unless the value already is an int (as parsed from JSON) or None."""
+    if value is None or isinstance(value, int):
+        return value
+    return int(value)
 
 
 class SlideScoreResult:
     # pylint: disable=too-many-instance-attributes
     """Slidescore wrapper class for storing SlideScore server responses."""
 
+    __slots__ = (
+        "_is_empty",
+        "image_id",
+        "image_name",
+        "user",
+        "tma_row",
+        "tma_col",
+        "tma_sample_id",
+        "question",
+        "answer",
+        "last_modified_on",
+        "_parsed_answer",
+        "_points_array",
+    )
+
     def __init__(self, slide_dict: Dict = None):
         """
         Parameters
@@ -53,7 +108,8 @@ class SlideScoreResult:
             SlideScore server response for annotations/labels.
         """
 
-        self.__slide_dict = slide_dict
+        # Only remember whether a response was given, so the response dictionary itself can be freed.
+        self._is_empty = slide_dict is None
         if not slide_dict:
             slide_dict = {
                 "imageID": 0,
@@ -67,24 +123,95 @@ class SlideScoreResult:
                 "lastModifiedOn": None,
             }
 
-        self.image_id = int(slide_dict["imageID"])
+        self.image_id = _as_int(slide_dict["imageID"])
         self.image_name = slide_dict["imageName"]
         self.user = slide_dict["user"]
-        self.tma_row = int(slide_dict["tmaRow"]) if "tmaRow" in slide_dict else None
-        self.tma_col = int(slide_dict["tmaCol"]) if "tmaCol" in slide_dict else None
+        self.tma_row = _as_int(slide_dict["tmaRow"]) if "tmaRow" in slide_dict else None
+        self.tma_col = _as_int(slide_dict["tmaCol"]) if "tmaCol" in slide_dict else None
         self.tma_sample_id = slide_dict["tmaSampleID"] if "tmaSampleID" in slide_dict else ""
         self.question = slide_dict["question"]
         self.answer = slide_dict["answer"]
         self.last_modified_on = slide_dict["lastModifiedOn"] if "lastModifiedOn" in slide_dict else ""
 
-        self.points = None
-        if self.answer is not None and self.answer[:2] == "[{":
-            annos = json.loads(self.answer)
-            if len(annos) > 0:
-                if hasattr(annos[0], "type"):
-                    self.annotations = annos
-                else:
-                    self.points = annos
+        # The answer is parsed lazily, on first access of `points` or `annotations`.
+        self._parsed_answer: Optional[List] = _UNPARSED
+        self._points_array: Optional["np.ndarray"] = _UNPARSED
+
+    @classmethod
+    def from_values(
+        cls, image_id: Union[int, str], image_name: str, user: str, question: str, answer: str
+    ) -> "SlideScoreResult":
+        """
+        Create a result from its values directly, without building a SlideScore response dictionary first. This is
+        useful when creating many results, e.g. when uploading them.
+
+        Parameters
+        ----------
+        image_id : int or str
+        image_name : str
+        user : str
+        question : str
+        answer : str
+
+        Returns
+        -------
+        SlideScoreResult
+        """
+        result = cls.__new__(cls)
+        result._is_empty = False
+        result.image_id = _as_int(image_id)
+        result.image_name = image_name
+        result.user = user
+        result.tma_row = None
+        result.tma_col = None
+        result.tma_sample_id = ""
+        result.question = question
+        result.answer = answer
+        result.last_modified_on = ""
+        result._parsed_answer = _UNPARSED
+        result._points_array = _UNPARSED
+        return result
+
+    def _get_parsed_answer(self) -> Optional[List]:
+        """The answer decoded as JSON, or None if the answer does not contain annotations."""
+        if self._parsed_answer is _UNPARSED:
+            self._parsed_answer = None
+            if self.answer is not None and self.answer.startswith("[{"):
+                annos = json.loads(self.answer)
+                if len(annos) > 0:
+                    self._parsed_answer = annos
+        return self._parsed_answer
+
+    @property
+    def points(self) -> Optional[List]:
+        """The points in the answer, parsed on first access."""
+        annos = self._get_parsed_answer()
+        if annos is None or hasattr(annos[0], "type"):
+            return None
+        return annos
+
+    @property
+    def points_array(self) -> Optional["np.ndarray"]:
+        """The points in the answer as an (N, 2) array of x, y coordinates."""
+        if self._points_array is _UNPARSED:
+            import numpy as np  # pylint: disable=import-outside-toplevel
+
+            points = self.points
+            if points is None:
+                self._points_array = None
+            else:
+                x_coords = np.fromiter((point["x"] for point in points), dtype=np.float64, count=len(points))
+                y_coords = np.fromiter((point["y"] for point in points), dtype=np.float64, count=len(points))
+                self._points_array = np.column_stack((x_coords, y_coords))
+        return self._points_array
+
+    @property
+    def annotations(self) -> Optional[List]:
+        """The annotations in the answer, parsed on first access."""
+        annos = self._get_parsed_answer()
+        if annos is None or not hasattr(annos[0], "type"):
+            return None
+        return annos
 
     def to_row(self) -> str:
         """
@@ -95,13 +222,13 @@ class SlideScoreResult:
         str
             Tab separated string
         """
-        if self.__slide_dict is None:
+        if self._is_empty:
             return ""
-        ret = str(self.image_id) + "\t" + self.image_name + "\t" + self.user + "\t"
+        fields = [str(self.image_id), self.image_name, self.user]
         if self.tma_row is not None:
-            ret = ret + str(self.tma_row) + "\t" + str(self.tma_col) + "\t" + self.tma_sample_id + "\t"
-        ret = ret + self.question + "\t" + str(self.answer)  # + "\t"#  + self.last_modified_on
-        return ret
+            fields += [str(self.tma_row), str(self.tma_col), self.tma_sample_id]
+        fields += [self.question, str(self.answer)]  # , self.last_modified_on
+        return "\t".join(fields)
 
     def __repr__(self):
         return (
@@ -142,13 +269,54 @@ class APIClient:
         self.verify_certificate = not disable_cert_checking
         self.base_url: Union[str, None] = None
         self.cookie: Union[str, None] = None
+        self._history_cache: Dict[pathlib.Path, Set[str]] = {}
+
+        # A single session is reused for all requests, so connections to the server are kept alive and pooled.
+        self._session = requests.Session()
+        self._session.headers.update(
+            {
+                "Accept": "application/json",
+                "Authorization": f"Bearer {self.api_token}",
+            }
+        )
+        self.max_connections = 0
+        self.set_max_connections(DEFAULT_MAX_CONNECTIONS)
+
+    def set_max_connections(self, max_connections: int) -> None:
+        """
+        Set the number of connections to the server which are kept open for reuse. This should be at least the number of
+        threads making requests simultaneously, otherwise connections are discarded and opened again.
+
+        Parameters
+        ----------
+        max_connections : int
+            Maximum number of pooled connections.
+        """
+        for adapter in self._session.adapters.values():
+            adapter.close()
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=max_connections, max_retries=retries)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self.max_connections = max_connections
+
+    def close(self) -> None:
+        """Close the underlying HTTP session and release its connections."""
+        self._session.close()
+
+    def __enter__(self) -> "APIClient":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
 
     def perform_request(
         self,
         request: str,
-        data: Optional[Dict],
+        data: Union[Dict, bytes, Iterable[bytes], None],
         method: str = "POST",
         stream: bool = False,
+        headers: Optional[Dict] = None,
     ) -> Response:
         """
         Base functionality for making requests to slidescore servers. Request should\
@@ -157,10 +325,13 @@ class APIClient:
         Parameters
         ----------
         request : str
-        data : dict
+        data : dict, bytes or Iterable[bytes]
+            Form data, an already encoded body, or an iterable of already encoded body chunks.
         method : str
             HTTP request method (POST or GET).
         stream : bool
+        headers : dict, optional
+            Additional headers for this request.
 
         Returns
         -------
@@ -169,16 +340,16 @@ class APIClient:
         if method not in ["POST", "GET"]:
             raise SlideScoreErrorException(f"Expected method to be either `POST` or `GET`. Got {method}.")
 
-        headers = {
-            "Accept": "application/json",
-            "Authorization": f"Bearer {self.api_token}",
-        }
-        url = urllib.parse.urljoin(self.end_point, request)
+        if "://" in request or request.startswith("/"):
+            url = urllib.parse.urljoin(self.end_point, request)
+        else:
+            # Plain relative requests are the common case, and `end_point` always ends with a "/".
+            url = self.end_point + request
 
         if method == "POST":
-            response = requests.post(url, verify=self.verify_certificate, headers=headers, data=data, timeout=60)
+            response = self._session.post(url, verify=self.verify_certificate, headers=headers, data=data, timeout=60)
         else:
-            response = requests.get(
+            response = self._session.get(
                 url,
                 verify=self.verify_certificate,
                 headers=headers,
@@ -205,7 +376,7 @@ class APIClient:
             Dictionary containing the images in the study.
         """
         response = self.perform_request("Images", {"studyid": study_id})
-        rjson = response.json()
+        rjson = _parse_json(response)
         self.logger.info("Found %s slides with SlideScore API for study ID %s.", len(rjson), study_id)
 
         return rjson
@@ -216,6 +387,8 @@ class APIClient:
         image: dict,
         save_dir: pathlib.Path,
         skip_if_exists: bool = True,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+        show_progress: bool = True,
     ) -> pathlib.Path:
         """
         Downloads a WSI from the SlideScore server, needs study_id and image.
@@ -228,6 +401,10 @@ class APIClient:
         image : dict
         save_dir : pathlib.Path
         skip_if_exists : bool
+        chunk_size : int
+            Size in bytes of the chunks in which the slide is written to disk.
+        show_progress : bool
+            Show a progress bar of the downloaded bytes.
 
         Returns
         -------
@@ -237,42 +414,113 @@ class APIClient:
         """
         image_id = image["id"]
         filesize = image["fileSize"]
-        response = self.perform_request(
-            "DownloadSlide",
-            {"studyid": study_id, "imageid": image_id},
-            method="GET",
-            stream=True,
-        )
+
+        image_dir = save_dir / str(image_id)
+
+        # If a previous download was interrupted, try to resume it from where it stopped.
+        partial_file = self._find_partial_download(image_dir)
+        offset = partial_file.stat().st_size if partial_file is not None else 0
+        if partial_file is not None and filesize and offset >= int(filesize):
+            if offset == int(filesize):
+                # The download was interrupted after the last byte was written, so only the rename is missing.
+                write_to = partial_file.with_suffix("")
+                self.logger.info("Download of %s was already complete.", write_to)
+                os.replace(partial_file, write_to)
+                self._write_to_history(image_dir, write_to.name)
+                return write_to
+            self.logger.warning("Partial download %s is larger than the slide, restarting.", partial_file)
+            partial_file.unlink()
+            partial_file, offset = None, 0
+        response = self._request_slide(study_id, image_id, offset)
 
         raw = response.headers["Content-Disposition"]
         filename = self._get_filename(raw)
-        self.logger.info("Writing to %s (reporting file size of %s)...", save_dir / filename, filesize)
-        save_dir = save_dir / str(image_id)
-        save_dir.mkdir(exist_ok=True)
-        write_to = save_dir / filename
-        history = self._read_from_history(save_dir)
-
-        if skip_if_exists and str(filename) in history:
-            self.logger.info("File %s already downloaded. Skipping.", save_dir / filename)
+        write_to = image_dir / filename
+        self.logger.info("Writing to %s (reporting file size of %s)...", write_to, filesize)
+        image_dir.mkdir(exist_ok=True)
+        history = self._read_from_history(image_dir)
+
+        if skip_if_exists and write_to.name in history:
+            self.logger.info("File %s already downloaded. Skipping.", write_to)
             response.close()
             return write_to
 
         temp_write_to = write_to.with_suffix(write_to.suffix + ".partial")
 
-        with tqdm.wrapattr(
-            open(temp_write_to, "wb"),
-            "write",
-            miniters=1,
-            desc=str(filename),
-            total=None,
-        ) as file:
-            for chunk in response.iter_content(chunk_size=4096):
-                file.write(chunk)
-        shutil.move(str(temp_write_to), str(write_to))
-
-        self._write_to_history(save_dir, write_to.name)
+        resume = response.status_code == 206
+        if resume and temp_write_to != partial_file:
+            # The partial file belongs to a different filename, so start over.
+            response.close()
+            response = self._request_slide(study_id, image_id, 0)
+            resume = False
+        if not resume and partial_file is not None and partial_file != temp_write_to:
+            # Remove the partial file which cannot be resumed, otherwise it is found again by every later download.
+            partial_file.unlink()
+        if resume:
+            self.logger.info("Resuming download of %s from byte %s.", write_to, offset)
+
+        with open(temp_write_to, "ab" if resume else "wb", buffering=0) as file, tqdm(
+            desc=write_to.name,
+            total=int(filesize) if filesize else None,
+            initial=offset if resume else 0,
+            unit="B",
+            unit_scale=True,
+            disable=not show_progress,
+        ) as progress_bar:
+            if response.headers.get("Content-Encoding"):
+                # The content needs to be decoded, so let requests take care of that.
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    file.write(chunk)
+                    progress_bar.update(len(chunk))
+            else:
+                # Copy the raw bytes straight from the socket to the file.
+                response.raw.decode_content = False
+                shutil.copyfileobj(
+                    CallbackIOWrapper(progress_bar.update, response.raw, "read"), file, length=chunk_size
+                )
+        os.replace(temp_write_to, write_to)
+
+        self._write_to_history(image_dir, write_to.name)
         return write_to
 
+    def _request_slide(self, study_id: int, image_id: int, offset: int = 0) -> Response:
+        """
+        Request a slide download, starting at byte `offset`. The server answers 206 if it honors the offset. If the
+        server cannot satisfy the range (416), or answers with a range which does not start at `offset`, the whole
+        slide is requested instead.
+        """
+        try:
+            response = self.perform_request(
+                "DownloadSlide",
+                {"studyid": study_id, "imageid": image_id},
+                method="GET",
+                stream=True,
+                headers={"Range": f"bytes={offset}-"} if offset > 0 else None,
+            )
+        except requests.HTTPError as exception:
+            if offset == 0 or exception.response is None or exception.response.status_code != 416:
+                raise
+        else:
+            if offset == 0 or response.status_code != 206:
+                return response
+            # Appending any other range than the requested one would silently corrupt the slide.
+            match = _CONTENT_RANGE_REGEX.match(response.headers.get("Content-Range", ""))
+            if match is not None and int(match.group(1)) == offset:
+                return response
+            response.close()
+        self.logger.info("Cannot resume download of image %s from byte %s, restarting.", image_id, offset)
+        return self._request_slide(study_id, image_id, 0)
+
+    @staticmethod
+    def _find_partial_download(save_dir: pathlib.Path) -> Optional[pathlib.Path]:
+        """Find the partially downloaded file in the directory of an image, if any."""
+        if not save_dir.is_dir():
+            return None
+        partial_files = list(save_dir.glob("*.partial"))
+        if len(partial_files) != 1 or partial_files[0].stat().st_size == 0:
+            return None
+        return partial_files[0]
+
     def get_results(self, study_id: int, **kwargs) -> Iterable[SlideScoreResult]:
         """
         Basic functionality to download all annotations made for a particular study.
@@ -291,14 +539,61 @@ class APIClient:
         List[SlideScoreResult]
             List of SlideScore results.
         """
+        rjson = self._request_scores(study_id, **kwargs)
+
+        # Consume the parsed list from the front, so entries can be garbage collected once they are yielded.
+        rjson.reverse()
+        while rjson:
+            yield SlideScoreResult(rjson.pop())
+
+    def get_results_bulk(self, study_id: int, **kwargs) -> Dict[str, Union["np.ndarray", List]]:
+        """
+        Download all annotations made for a particular study in a columnar layout. This avoids constructing a
+        SlideScoreResult per annotation, and is therefore faster for studies with many results.
+
+        Parameters
+        ----------
+        study_id : int
+            ID of SlideScore study.
+        **kwargs: dict
+            Dictionary with optional API flags, see `get_results`.
+
+        Returns
+        -------
+        dict
+            Dictionary mapping the column names to the columns. The integer columns `image_id`, `tma_row` and
+            `tma_col` are NumPy arrays, where a missing TMA row or column is -1. The other columns
+            (`image_name`, `user`, `question`, `answer` and `last_modified_on`) are lists.
+        """
+        import numpy as np  # pylint: disable=import-outside-toplevel
+
+        rjson = self._request_scores(study_id, **kwargs)
+
+        def int_column(key: str) -> np.ndarray:
+            values = (-1 if row.get(key) is None else _as_int(row[key]) for row in rjson)
+            return np.fromiter(values, dtype=np.int64, count=len(rjson))
+
+        return {
+            "image_id": int_column("imageID"),
+            "image_name": [row["imageName"] for row in rjson],
+            "user": [row["user"] for row in rjson],
+            "tma_row": int_column("tmaRow"),
+            "tma_col": int_column("tmaCol"),
+            "question": [row["question"] for row in rjson],
+            "answer": [row["answer"] for row in rjson],
+            "last_modified_on": [row.get("lastModifiedOn", "") for row in rjson],
+        }
+
+    def _request_scores(self, study_id: int, **kwargs) -> List[Dict]:
         optional_keys = ["question", "email", "imageid", "caseid"]
         if any(_ not in optional_keys for _ in kwargs):
             raise RuntimeError(f"Expected optional keys to be any of {', '.join(optional_keys)}. Got {kwargs.keys()}.")
 
         response = self.perform_request("Scores", {"studyid": study_id, **kwargs})
-        rjson = response.json()
-        for line in rjson:
-            yield SlideScoreResult(line)
+        try:
+            return _parse_json(response)
+        finally:
+            response.close()
 
     def get_config(self, study_id: int) -> dict:
         """
@@ -314,14 +609,14 @@ class APIClient:
         dict
         """
         response = self.perform_request("GetConfig", {"studyid": study_id})
-        rjson = response.json()
+        rjson = _parse_json(response)
 
         if not rjson["success"]:
             raise SlideScoreErrorException(f"Configuration for study id {study_id} not returned succesfully")
 
         return rjson["config"]
 
-    def upload_results(self, study_id: int, results: List[SlideScoreResult]) -> bool:
+    def upload_results(self, study_id: int, results: Iterable[SlideScoreResult], chunked: bool = False) -> bool:
         """
         Basic functionality to upload all annotations made for a particular study.
         Returns true if successful.
@@ -334,20 +629,34 @@ class APIClient:
         Parameters
         ----------
         study_id : int
-        results : List[str]
+        results : Iterable[SlideScoreResult]
+            The results are encoded one by one, so this can be a generator.
+        chunked : bool
+            Send the results while they are encoded, with chunked transfer encoding, rather than as a single body with a
+            Content-Length. This requires a server which accepts chunked requests.
 
         Returns
         -------
         bool
         """
-        results_as_row = [r.to_row() for r in results]
-        sres = "\n" + "\n".join(results_as_row)
-        response = self.perform_request("UploadResults", {"studyid": study_id, "results": sres})
-        rjson = response.json()
+        form = self._iter_results_form(study_id, results)
+        response = self.perform_request(
+            "UploadResults",
+            form if chunked else b"".join(form),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        rjson = _parse_json(response)
         if not rjson["success"]:
             raise SlideScoreErrorException(rjson["log"])
         return True
 
+    @staticmethod
+    def _iter_results_form(study_id: int, results: Iterable[SlideScoreResult]) -> Iterator[bytes]:
+        """Encode the UploadResults form body incrementally, so it can be joined or sent with chunked encoding."""
+        yield urllib.parse.urlencode({"studyid": study_id, "results": ""}).encode("ascii")
+        for result in results:
+            yield urllib.parse.quote_plus("\n" + result.to_row()).encode("ascii")
+
     def upload_asap(  # pylint: disable=R0913
         self,
         image_id: int,
@@ -367,7 +676,7 @@ class APIClient:
                 "asapAnnotation": asap_annotation,
             },
         )
-        rjson = response.json()
+        rjson = _parse_json(response)
         if not rjson["success"]:
             raise SlideScoreErrorException(rjson["log"])
         return True
@@ -387,7 +696,7 @@ class APIClient:
             Image metadata as stored in SlideScore.
         """
         response = self.perform_request("GetImageMetadata", {"imageId": image_id}, "GET")
-        rjson = response.json()
+        rjson = _parse_json(response)
         if not rjson["success"]:
             raise SlideScoreErrorException(rjson["log"])
         return rjson["metadata"]
@@ -398,7 +707,7 @@ class APIClient:
             "ExportASAPAnnotations",
             {"imageid": image_id, "user": user, "question": question},
         )
-        rjson = response.json()
+        rjson = _parse_json(response)
         if not rjson["success"]:
             raise SlideScoreErrorException(rjson["log"])
         rawresp = response.text
@@ -423,8 +732,8 @@ class APIClient:
         if self.base_url is None:
             raise RuntimeError
 
-        response = self.perform_request(f"GetTileServer?imageId={str(image_id)}", None, method="GET")
-        rjson: Dict = dict(response.json())
+        response = self.perform_request(f"GetTileServer?imageId={image_id}", None, method="GET")
+        rjson: Dict = _parse_json(response)
         url_parts = "/".join(["i", str(image_id), rjson["urlPart"], "_files"])
         return (
             urllib.parse.urljoin(self.base_url, url_parts),
@@ -462,9 +771,41 @@ class APIClient:
         """
         if self.base_url is None:
             raise RuntimeError
+        return self._fetch_tile(level, x_coord, y_coord)
+
+    def get_tiles(self, level: int, coords: Iterable[Tuple[int, int]], max_workers: int = 16) -> List[Image]:
+        """
+        Gets multiple tiles from WSI for given magnification level. The tiles are downloaded concurrently.
+        See `get_tile` for details on the tile coordinates.
+
+        Parameters
+        ----------
+        level : int
+        coords : Iterable[Tuple[int, int]]
+            The (x, y) coordinates of the tiles to download.
+        max_workers : int
+            Maximum number of tiles to download simultaneously.
+
+        Returns
+        -------
+        List[PIL.Image]
+            Requested tiles, in the same order as `coords`.
+        """
+        if self.base_url is None:
+            raise RuntimeError
+        # Keep a connection open for every thread.
+        if max_workers > self.max_connections:
+            self.set_max_connections(max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda coord: self._fetch_tile(level, *coord), coords))
+
+    def _fetch_tile(self, level: int, x_coord: int, y_coord: int) -> Image:
         cookies: dict = {"t": self.cookie}
-        response = requests.get(
-            self.base_url + f"/{str(level)}/{str(x_coord)}_{str(y_coord)}.jpeg",
+        # The tile server is authorized by the cookie, so do not send it the API token of the session.
+        response = self._session.get(
+            f"{self.base_url}/{level}/{x_coord}_{y_coord}.jpeg",
+            verify=self.verify_certificate,
+            headers={"Authorization": None},
             stream=True,
             cookies=cookies,
             timeout=60,
@@ -485,26 +826,38 @@ class APIClient:
         str
             Filename extracted from HTTP header.
         """
-        filename_list = re.findall(r"filename\*?=([^;]+)", string, flags=re.IGNORECASE)
-        filename: pathlib.Path = pathlib.Path(filename_list[0].strip().strip('"'))
+        message = email.message.Message()
+        message["Content-Disposition"] = string
+        # The email parser handles quoting and the RFC 2231 encoded `filename*` parameter, which is parsed as a tuple.
+        # As per RFC 6266, `filename*` takes precedence over `filename`.
+        params = message.get_params(header="Content-Disposition", failobj=[])
+        encoded = [value for key, value in params if key == "filename" and isinstance(value, tuple)]
+        parsed_filename = email.utils.collapse_rfc2231_value(encoded[0]) if encoded else message.get_filename()
+        if not parsed_filename:
+            match = _FILENAME_REGEX.search(string)
+            if match is None:
+                raise SlideScoreErrorException(f"Could not find a filename in header {string}.")
+            parsed_filename = match.group(1).strip().strip('"')
+        filename: pathlib.Path = pathlib.Path(parsed_filename)
         return filename
 
-    @staticmethod
-    def _write_to_history(save_dir: pathlib.Path, filename: Union[str, pathlib.Path]):
+    def _write_to_history(self, save_dir: pathlib.Path, filename: Union[str, pathlib.Path]) -> None:
         with open(save_dir / ".download_history.txt", "a", encoding="utf-8") as file:
             file.write(f"{filename}\n")
+        self._read_from_history(save_dir).add(str(filename))
 
-    @staticmethod
-    def _read_from_history(save_dir: pathlib.Path):
-        history_filename = save_dir / ".download_history.txt"
-        if not history_filename.is_file():
-            return []
+    def _read_from_history(self, save_dir: pathlib.Path) -> Set[str]:
+        if save_dir in self._history_cache:
+            return self._history_cache[save_dir]
 
-        with open(history_filename, "r", encoding="utf-8") as file:
-            content = file.readlines()
+        history: Set[str] = set()
+        history_filename = save_dir / ".download_history.txt"
+        if history_filename.is_file():
+            with open(history_filename, "r", encoding="utf-8") as file:
+                history = {_.strip() for _ in file}
 
-        content = [_.strip() for _ in content]
-        return content
+        self._history_cache[save_dir] = history
+        return history
 
 
 class SlideScoreErrorException(Exception):
@@ -5,30 +5,72 @@
 This module contains the CLI utilities that can be used with slidescore in python.
 
 """
+
+from __future__ import annotations
+
 import argparse
 import csv
+import ctypes
 import json
 import logging
 import os
 import pathlib
 import re
+import sqlite3
 import sys
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack, closing
 from enum import Enum
+from itertools import islice
 from pathlib import Path
-from typing import Iterable, Optional
-
-import shapely.geometry
-from tqdm import tqdm
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
 
-from slidescore_api.api import APIClient, SlideScoreResult, build_client
 from slidescore_api.cli_logging import build_cli_logger
-from slidescore_api.utils.annotations import SlideScoreAnnotations, save_shapely
+from slidescore_api.utils.cache import cached_get_config, cached_get_images
+
+# The API client (with requests and tqdm), NumPy, shapely, multiprocessing and the annotation utilities are imported
+# where they are used. Showing the help is then fast, and subcommands only load what they need.
+if TYPE_CHECKING:
+    import numpy as np
+    import shapely.geometry
+
+    from slidescore_api.api import APIClient, SlideScoreResult
 
 logger = logging.getLogger(__name__)
 
+# Increase csv field size limit for large rows. The limit is stored in a C long, which is 32 bits on Windows, so use the
+# largest value that type can hold.
+csv.field_size_limit(ctypes.c_ulong(-1).value // 2)
+
 ANNOSHAPE_TYPES = ["polygon", "rect", "ellipse", "brush", "heatmap"]
 
+# Number of GeoJSON features which are converted to shapely geometries at once.
+GEOJSON_BATCH_SIZE = 10000
+
+# Number of results which are uploaded to SlideScore per request.
+UPLOAD_BATCH_SIZE = 1000
+
+# Buffer size of the file the raw annotations are written to.
+RAW_BUFFER_SIZE = 1 << 20
+
+# Buffer size of the results file which is read when uploading labels from a CSV.
+CSV_BUFFER_SIZE = 1 << 20
+
+# Options of the per-image progress bars. Results arrive in bursts when requested concurrently, so redraw less often and
+# estimate the remaining time from the average rate.
+PROGRESS_BAR_KWARGS = {"mininterval": 0.5, "smoothing": 0}
+
+# Table the annotations are stored in with the SQLITE label output type. Columns follow the raw output.
+_SQLITE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS annotations (image_id INTEGER, image_name TEXT, user TEXT, tma_row INTEGER, "
+    "tma_col INTEGER, tma_sample_id TEXT, question TEXT, answer TEXT)"
+)
+
+# Templates of the JSON of uploaded annotations. These produce the same output as `json.dumps` without whitespace.
+_POINT_TEMPLATE = '{"x":%d,"y":%d},'
+_POLYGON_TEMPLATE = '{"type":"polygon","points":%s}'
+
 
 class LabelOutputType(Enum):
     """
@@ -38,6 +80,7 @@ class LabelOutputType(Enum):
     JSON: str = "json"
     RAW: str = "raw"
     GEOJSON: str = "geojson"
+    SQLITE: str = "sqlite"
 
 
 def parse_api_token(data: Optional[Path] = None) -> str:
@@ -70,30 +113,24 @@ def parse_api_token(data: Optional[Path] = None) -> str:
     return api_token
 
 
-def _shapely_to_slidescore(shapely_object):
-    shapely_type = type(shapely_object)
-    if shapely_type == shapely.geometry.Polygon:
-        if len(shapely_object.interiors) != 0:
-            if any(interior.area > 0 for interior in shapely_object.interiors):
-                raise RuntimeError(f"Expected Polygon to have empty interior. Got {list(shapely_object.interiors)}.")
+def _coordinates_to_points(coordinates: "np.ndarray") -> str:
+    """
+    Convert an (N, 2) coordinate array to a JSON array of SlideScore points, truncating the coordinates to integers.
+    The JSON is formatted directly with a template repeated for every point, which avoids building a dictionary per
+    point and encoding those afterwards.
+    """
+    flat_coordinates = coordinates.astype("int64").ravel().tolist()
+    return "[" + (_POINT_TEMPLATE * len(coordinates)).rstrip(",") % tuple(flat_coordinates) + "]"
 
-        coordinates = shapely_object.exterior.coords
-        if len(coordinates) < 3:
-            raise RuntimeError(f"Malformed Polygon. Got {coordinates}.")
-        answer = [{"x": int(x), "y": int(y)} for x, y in coordinates]
-        output = [{"type": "polygon", "points": answer}]
 
-    elif shapely_type == shapely.geometry.Point:
-        output = [{"x": int(shapely_object.x), "y": int(shapely_object.y)}]
+def _polygon_to_slidescore(shapely_object: "shapely.geometry.Polygon") -> Iterable[str]:
+    import shapely  # pylint: disable=import-outside-toplevel
 
-    elif shapely_type == shapely.geometry.MultiPolygon:
-        output = []
-        for shape in shapely_object.geoms:
-            shape_coords = [{"x": int(x), "y": int(y)} for x, y in shape.exterior.coords]
-            output.append({"type": "polygon", "points": shape_coords})
-
-    else:
-        raise NotImplementedError
+    # Interiors are checked in bulk by `_check_empty_interiors`.
+    coordinates = shapely_object.exterior.coords
+    if len(coordinates) < 3:
+        raise RuntimeError(f"Malformed Polygon. Got {coordinates}.")
+    answer = _coordinates_to_points(shapely.get_coordinates(shapely_object.exterior))
 
     # THis can be useful for boxes
     # x0, y0, x1, y1 = curr_shape.bounds
@@ -104,7 +141,136 @@ def _shapely_to_slidescore(shapely_object):
     #     "corner": {"x": int(x0), "y": int(y0)},
     #     "size": {"x": int(h), "y": int(w)},
     # }
-    return output
+    return (_POLYGON_TEMPLATE % answer,)
+
+
+def _point_to_slidescore(shapely_object: "shapely.geometry.Point") -> Iterable[str]:
+    return (_POINT_TEMPLATE.rstrip(",") % (int(shapely_object.x), int(shapely_object.y)),)
+
+
+def _multipolygon_to_slidescore(shapely_object: "shapely.geometry.MultiPolygon") -> Iterable[str]:
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    import shapely
+
+    # Get the coordinates of all exteriors at once, and split them per polygon.
+    exteriors = shapely.get_exterior_ring(shapely.get_parts(shapely_object))
+    coordinates, index = shapely.get_coordinates(exteriors, return_index=True)
+    splits = np.flatnonzero(np.diff(index)) + 1
+    return (_POLYGON_TEMPLATE % _coordinates_to_points(shape_coords) for shape_coords in np.split(coordinates, splits))
+
+
+# Keyed by the class name, so shapely is not needed to build the table.
+_SHAPELY_TO_SLIDESCORE = {
+    "Polygon": _polygon_to_slidescore,
+    "Point": _point_to_slidescore,
+    "MultiPolygon": _multipolygon_to_slidescore,
+}
+
+
+def _shapely_to_slidescore(shapely_object) -> Iterable[str]:
+    convert = _SHAPELY_TO_SLIDESCORE.get(type(shapely_object).__name__)
+    if convert is None:
+        raise NotImplementedError
+    return convert(shapely_object)
+
+
+def _geometries_from_features(features: List[Dict]) -> List:
+    """
+    Convert GeoJSON features to shapely geometries. Polygons without holes, which make up the bulk of the annotations,
+    are constructed in a single vectorized call per coordinate dimension instead of one by one.
+
+    Parameters
+    ----------
+    features : list
+        GeoJSON features.
+
+    Returns
+    -------
+    list
+        Shapely geometries, in the same order as the features.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    import shapely.geometry
+
+    geometries: List = [None] * len(features)
+    # The rings are grouped by the dimension of their first point, as features can mix 2D and 3D coordinates.
+    rings_per_dimension: Dict[int, List] = defaultdict(list)
+    for idx, feature in enumerate(features):
+        geometry = feature["geometry"]
+        coordinates = geometry["coordinates"]
+        if geometry["type"] == "Polygon" and len(coordinates) == 1 and len(coordinates[0]) >= 4:
+            rings_per_dimension[len(coordinates[0][0])].append((idx, coordinates[0]))
+        else:
+            geometries[idx] = shapely.geometry.shape(geometry)
+
+    for indexed_rings in rings_per_dimension.values():
+        positions, rings = zip(*indexed_rings)
+        ring_coordinates = np.array([point for ring in rings for point in ring], dtype=np.float64)
+        ring_indices = np.repeat(np.arange(len(rings)), [len(ring) for ring in rings])
+        polygons = shapely.polygons(shapely.linearrings(ring_coordinates, indices=ring_indices))
+        for idx, polygon in zip(positions, polygons):
+            geometries[idx] = polygon
+
+    return geometries
+
+
+def _check_empty_interiors(geometries: List, features: List[Dict]) -> None:
+    """
+    Warn about polygons with an interior which encloses an area, as SlideScore polygons cannot have holes. These holes
+    are dropped when uploading. All interior rings of all geometries are checked with a few vectorized calls.
+
+    Parameters
+    ----------
+    geometries : list
+        Shapely geometries.
+    features : list
+        The GeoJSON features the geometries were created from, used to identify them in the warning.
+
+    Returns
+    -------
+    None
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    import shapely
+
+    geometries_array = np.asarray(geometries, dtype=object)
+    num_interiors = shapely.get_num_interior_rings(geometries_array)
+    candidates = np.flatnonzero(num_interiors > 0)
+    if len(candidates) == 0:
+        return
+
+    counts = num_interiors[candidates]
+    owners = np.repeat(candidates, counts)
+    ring_indices = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    interiors = shapely.get_interior_ring(geometries_array[owners], ring_indices)
+    # The area of a ring itself is always zero, so measure the area it encloses.
+    enclosed_areas = shapely.area(shapely.polygons(interiors))
+    for idx in np.unique(owners[enclosed_areas > 0]):
+        logger.warning(
+            "Feature %s has a polygon with a hole, which cannot be uploaded to SlideScore. The hole is dropped.",
+            features[idx].get("id", idx),
+        )
+
+
+def _iter_feature_batches(features: List[Dict]) -> Iterator[List[Dict]]:
+    """Split the features in batches. Each batch is removed from `features`, so it is released once converted."""
+    while features:
+        batch = features[:GEOJSON_BATCH_SIZE]
+        del features[:GEOJSON_BATCH_SIZE]
+        yield batch
+
+
+def _convert_features(batch: List[Dict]) -> Dict[str, List[str]]:
+    """Convert a batch of GeoJSON features to SlideScore answers in JSON, grouped by classification name."""
+    geometries = _geometries_from_features(batch)
+    _check_empty_interiors(geometries, batch)
+    answers: Dict[str, List[str]] = defaultdict(list)
+    for row, shapely_object in zip(batch, geometries):
+        answers[row["properties"]["classification"]["name"]].extend(_shapely_to_slidescore(shapely_object))
+    return answers
 
 
 def _upload_labels_from_geojson(args: argparse.Namespace) -> None:
@@ -119,33 +285,38 @@ def _upload_labels_from_geojson(args: argparse.Namespace) -> None:
     -------
     None
     """
-    url = args.slidescore_url
-    api_token = parse_api_token(args.token_path)
     study_id = args.study_id
-    client = APIClient(url, api_token)
-    wsi_results = []
+    client = args.client
 
     answers = defaultdict(list)  # type: ignore
-    with open(args.geojson_file, "r", encoding="utf-8") as geo_json_file:
-        data = json.load(geo_json_file)["features"]
-        for row in data:
-            shapely_object = shapely.geometry.shape(row["geometry"])
-            answer = _shapely_to_slidescore(shapely_object)
-            answers[row["properties"]["classification"]["name"]] += answer
-
-    for question in answers:
-        wsi_result = SlideScoreResult(
+    features = json.loads(Path(args.geojson_file).read_bytes())["features"]
+    with ExitStack() as stack:
+        convert: Callable = map
+        if args.num_workers > 1:
+            from concurrent.futures import ProcessPoolExecutor  # pylint: disable=import-outside-toplevel
+
+            convert = stack.enter_context(ProcessPoolExecutor(max_workers=args.num_workers)).map
+        for converted in convert(_convert_features, _iter_feature_batches(features)):
+            for question, answer in converted.items():
+                answers[question].extend(answer)
+
+    client.upload_results(study_id, _iter_geojson_results(args, answers))
+
+
+def _iter_geojson_results(args: argparse.Namespace, answers: Dict[str, List[str]]) -> Iterator[SlideScoreResult]:
+    """Yield one result per question. The answers are removed from `answers` once serialized to free them early."""
+    from slidescore_api.api import SlideScoreResult  # pylint: disable=import-outside-toplevel
+
+    for question in list(answers):
+        yield SlideScoreResult(
             {
                 "imageID": args.image_id,
                 "imageName": args.image_name,
                 "user": args.user,
                 "question": question,
-                "answer": str(answers[question]).replace("'", '"'),
+                "answer": "[" + ",".join(answers.pop(question)) + "]",
             }
         )
-        wsi_results.append(wsi_result)
-
-    client.upload_results(study_id, wsi_results)
 
 
 def _upload_labels_from_csv(args: argparse.Namespace) -> None:
@@ -160,39 +331,45 @@ def _upload_labels_from_csv(args: argparse.Namespace) -> None:
     -------
     None
     """
-    url = args.slidescore_url
-    api_token = parse_api_token(args.token_path)
     study_id = args.study_id
-    client = APIClient(url, api_token)
-    wsi_results = []
-
-    # Increase csv field size limit for large rows
-    try:
-        csv.field_size_limit(sys.maxsize)
-    except OverflowError:
-        csv.field_size_limit(int(sys.maxsize / 10))
-
-    with open(args.results_file, "r", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=args.csv_delimiter, fieldnames=args.csv_fieldnames)
+    client = args.client
+
+    # Upload in batches, so the results of the whole file are never kept in memory at once. Each batch is uploaded in
+    # the background while the next one is read, with at most one upload in flight to keep the original order.
+    results = _iter_csv_results(args)
+    batch_size = args.upload_batch_size
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending_upload = None
+        for wsi_results in iter(lambda: list(islice(results, batch_size)), []):
+            if pending_upload is not None:
+                pending_upload.result()
+            pending_upload = executor.submit(client.upload_results, study_id, wsi_results)
+        if pending_upload is not None:
+            pending_upload.result()
+
+
+def _iter_csv_results(args: argparse.Namespace) -> Iterator[SlideScoreResult]:
+    """Read the results file given in the CLI arguments row by row."""
+    from slidescore_api.api import SlideScoreResult  # pylint: disable=import-outside-toplevel
+
+    # Look up the column positions once, rather than building a dictionary for every row.
+    fieldnames = args.csv_fieldnames
+    image_id_idx = fieldnames.index("imageID")
+    image_name_idx = fieldnames.index("imageName")
+    # The user column is not needed when it is overridden from the command line.
+    user_override = args.user
+    user_idx = fieldnames.index("user") if user_override is None else -1
+    question_idx = fieldnames.index("question")
+    answer_idx = fieldnames.index("answer")
+
+    with open(args.results_file, "r", encoding="utf-8", newline="", buffering=CSV_BUFFER_SIZE) as csvfile:
+        reader = csv.reader(csvfile, delimiter=args.csv_delimiter)
         for row in reader:
-            image_id = row["imageID"]
-            image_name = row["imageName"]
-            user = row["user"] if args.user is None else args.user
-            question = row["question"]
-            answer = row["answer"].replace("'", '"') + "\n"
-
-            wsi_result = SlideScoreResult(
-                {
-                    "imageID": image_id,
-                    "imageName": image_name,
-                    "user": user,
-                    "question": question,
-                    "answer": answer,
-                }
-            )
-            wsi_results.append(wsi_result)
-
-    client.upload_results(study_id, wsi_results)
+            if not row:
+                continue
+            user = row[user_idx] if user_override is None else user_override
+            answer = row[answer_idx].replace("'", '"') + "\n"
+            yield SlideScoreResult.from_values(row[image_id_idx], row[image_name_idx], user, row[question_idx], answer)
 
 
 def retrieve_questions(
@@ -200,6 +377,8 @@ def retrieve_questions(
     api_token: str,
     study_id: int,
     disable_certificate_check: bool = False,
+    cache_ttl: float = 0,
+    client: Optional[APIClient] = None,
 ) -> dict:
     """
     Retrieve the questions for a given study from SlideScore.
@@ -215,6 +394,10 @@ def retrieve_questions(
     study_id: int
         Study id as used by SlideScore.
     disable_certificate_check : bool
+    cache_ttl : float
+        Seconds a configuration cached on disk by a previous call can be reused. If 0, it is always requested.
+    client : APIClient, optional
+        The client to make the requests with. If not given, a client is built from the url, token and certificate check.
 
     Returns
     -------
@@ -222,10 +405,13 @@ def retrieve_questions(
         Returns scores corresponding to a particular question in the slidescore study.
 
     """
-    client = build_client(slidescore_url, api_token, disable_certificate_check)
+    if client is None:
+        from slidescore_api.api import build_client  # pylint: disable=import-outside-toplevel
+
+        client = build_client(slidescore_url, api_token, disable_certificate_check)
 
     # Get the configuration for this study. Requires specific permissions.
-    config = client.get_config(study_id)
+    config = cached_get_config(client, study_id, ttl=cache_ttl)
     scores = config["scores"]
     return scores
 
@@ -235,24 +421,18 @@ def _save_label_as_json(save_dir, image_id, image, annotations):
         "image_id": image_id,
         "study_id": image["studyID"],
         "image_name": image["name"],
-        "annotations": [],
+        # The points are parsed once and cached on the result, so reading them twice is cheap.
+        "annotations": [
+            {"user": annotation.user, "question": annotation.question, "data": annotation.points}
+            for annotation in annotations
+            if annotation.points
+        ],
     }
 
-    for annotation in annotations:
-        data = annotation.points
-        if not data:
-            continue
-
-        annotation_data["annotations"].append({"user": annotation.user, "question": annotation.question, "data": data})
-
     # Now save this to JSON.
+    # Serialize in one go without indentation, which allows `json` to use its C encoder.
     with open(save_dir / f"{image_id}.json", "w", encoding="utf-8") as file:
-        json.dump(annotation_data, file, indent=2)
-
-
-def _row_iterator(slidescore_annotations: Iterable[SlideScoreResult]):
-    for annotation in slidescore_annotations:
-        yield annotation.to_row()
+        file.write(json.dumps(annotation_data))
 
 
 def download_labels(  # pylint: disable=too-many-arguments,too-many-locals,too-many-branches
@@ -264,6 +444,10 @@ def download_labels(  # pylint: disable=too-many-arguments,too-many-locals,too-m
     email: Optional[str] = None,
     question: Optional[str] = None,
     disable_certificate_check: bool = False,
+    concurrency: int = 4,
+    cache_ttl: float = 0,
+    bulk: bool = False,
+    client: Optional[APIClient] = None,
 ) -> None:
     """
     Downloads all available annotations for a study on SlideScore from
@@ -287,15 +471,29 @@ def download_labels(  # pylint: disable=too-many-arguments,too-many-locals,too-m
         The question to obtain the labels for. If not given all labels will be obtained.
     disable_certificate_check : bool
         Disable HTTPS certificate check.
+    concurrency : int
+        Number of images for which the annotations are requested simultaneously.
+    cache_ttl : float
+        Seconds an image list cached on disk by a previous call can be reused. If 0, it is always requested.
+    bulk : bool
+        Request the annotations of all images in a single request, rather than one request per image. If the server
+        refuses, the annotations are requested per image instead.
+    client : APIClient, optional
+        The client to make the requests with. If not given, a client is built from the url, token and certificate check.
 
     Returns
     -------
     None
     """
-    client = build_client(slidescore_url, api_token, disable_certificate_check)
+    # pylint: disable=import-outside-toplevel
+    from tqdm import tqdm
+
+    if client is None:
+        from slidescore_api.api import build_client
+
+        client = build_client(slidescore_url, api_token, disable_certificate_check)
 
-    if not save_dir.is_dir():
-        save_dir.mkdir()
+    save_dir.mkdir(parents=True, exist_ok=True)
 
     extra_kwargs = {}
     if email is not None:
@@ -303,27 +501,237 @@ def download_labels(  # pylint: disable=too-many-arguments,too-many-locals,too-m
     if question is not None:
         extra_kwargs["question"] = question
 
-    images = client.get_images(study_id)
-
-    for image in tqdm(images):
-        image_id = image["id"]
-        annotations = client.get_results(study_id, imageid=image_id, **extra_kwargs)
-        if LabelOutputType[output_type] == LabelOutputType.JSON:
-            _save_label_as_json(save_dir, image_id, image, annotations)
-        elif LabelOutputType[output_type] == LabelOutputType.RAW:
-            with open(save_dir / "annotations.txt", "a", encoding="utf-8") as file:
-                for annotation in annotations:
-                    file.write(annotation.to_row() + "\n")
-        elif LabelOutputType[output_type] == LabelOutputType.GEOJSON:
+    images = cached_get_images(client, study_id, ttl=cache_ttl)
+
+    # Keep a connection open for every thread.
+    if concurrency > client.max_connections:
+        client.set_max_connections(concurrency)
+
+    def fetch_annotations(image: Dict) -> List[SlideScoreResult]:
+        return list(client.get_results(study_id, imageid=image["id"], **extra_kwargs))
+
+    # Only the requests are made concurrently, the results are saved in order from this thread.
+    label_output_type = LabelOutputType[output_type]
+    with ExitStack() as stack:
+        raw_file = None
+        database = None
+        if label_output_type == LabelOutputType.RAW:
+            raw_file = stack.enter_context(
+                open(save_dir / "annotations.txt", "a", encoding="utf-8", buffering=RAW_BUFFER_SIZE)
+            )
+        elif label_output_type == LabelOutputType.SQLITE:
+            database = stack.enter_context(closing(sqlite3.connect(save_dir / "annotations.sqlite")))
+            database.execute(_SQLITE_SCHEMA)
+        save_annotations = _build_annotation_saver(
+            save_dir, label_output_type, email, question, raw_file=raw_file, database=database
+        )
+        annotations_per_image: Optional[Iterable[List[SlideScoreResult]]] = None
+        if bulk:
+            annotations_per_image = _fetch_annotations_in_bulk(client, study_id, images, extra_kwargs)
+        if annotations_per_image is None:
+            # Only request a few images ahead of the one being saved, so not all annotations are held in memory at once.
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=concurrency))
+            annotations_per_image = _map_bounded(executor, fetch_annotations, images, max_pending=2 * concurrency)
+        for image, annotations in tqdm(zip(images, annotations_per_image), total=len(images), **PROGRESS_BAR_KWARGS):
+            save_annotations(image, annotations)
+
+        # All rows are inserted in a single transaction.
+        if database is not None:
+            database.commit()
+
+
+def _map_bounded(executor: Executor, function: Callable, items: Iterable, max_pending: int) -> Iterator[Any]:
+    """
+    Like `executor.map`, but only submit up to `max_pending` calls ahead of the result which is consumed. The results
+    are yielded in the order of `items`.
+
+    Parameters
+    ----------
+    executor : Executor
+    function : Callable
+        Function which is called with every item.
+    items : Iterable
+    max_pending : int
+        Maximum number of submitted calls whose results have not been yielded yet.
+
+    Returns
+    -------
+    Iterator
+        The results of the calls.
+    """
+    pending: deque = deque()
+    try:
+        for item in items:
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+            pending.append(executor.submit(function, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # If the results are not consumed completely, do not start the remaining calls.
+        for future in pending:
+            future.cancel()
+
+
+def _as_completed_bounded(
+    executor: Executor, function: Callable, items: Iterable, max_pending: int
+) -> Iterator[Tuple[Any, Any]]:
+    """
+    Like `_map_bounded`, but yield every result as soon as its call has finished, together with its item. Only up to
+    `max_pending` calls are submitted at any time.
+
+    Parameters
+    ----------
+    executor : Executor
+    function : Callable
+        Function which is called with every item.
+    items : Iterable
+    max_pending : int
+        Maximum number of submitted calls whose results have not been yielded yet.
+
+    Returns
+    -------
+    Iterator
+        Tuples of an item and the result of its call, in the order the calls finished.
+    """
+    items = iter(items)
+    pending: Dict[Future, Any] = {}
+    try:
+        while True:
+            for item in islice(items, max_pending - len(pending)):
+                pending[executor.submit(function, item)] = item
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+    finally:
+        # If the results are not consumed completely, do not start the remaining calls.
+        for future in pending:
+            future.cancel()
+
+
+def _fetch_annotations_in_bulk(
+    client: APIClient, study_id: int, images: List[Dict], extra_kwargs: Dict
+) -> Optional[List[List[SlideScoreResult]]]:
+    """
+    Request the annotations of all images in the study at once, and group them per image.
+
+    Parameters
+    ----------
+    client : APIClient
+    study_id : int
+    images : list
+        The images in the study, as returned by `APIClient.get_images`.
+    extra_kwargs : dict
+        Optional API flags passed to `APIClient.get_results`.
+
+    Returns
+    -------
+    list, optional
+        The annotations of every image, in the order of `images`. None if the server refused the request.
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+
+    results_by_image: Dict[Optional[int], List[SlideScoreResult]] = defaultdict(list)
+    # A request which keeps failing with a 5xx status, as large studies can with a gateway timeout, exhausts the retries
+    # of the session and raises a RetryError instead of an HTTPError.
+    try:
+        for result in client.get_results(study_id, **extra_kwargs):
+            results_by_image[result.image_id].append(result)
+    except (requests.exceptions.HTTPError, requests.exceptions.RetryError) as exception:
+        logger.warning("Could not request all annotations at once, requesting them per image instead: %s", exception)
+        return None
+    return [results_by_image.get(image["id"], []) for image in images]
+
+
+def _build_annotation_saver(
+    save_dir: Path,
+    output_type: LabelOutputType,
+    email: Optional[str],
+    question: Optional[str],
+    raw_file: Optional[TextIO] = None,
+    database: Optional[sqlite3.Connection] = None,
+) -> Callable[[Dict, List[SlideScoreResult]], None]:
+    """
+    Build the function which saves the annotations of an image in the given output type. The output type is resolved
+    once here, rather than for every image.
+
+    Parameters
+    ----------
+    save_dir : Path
+        Directory to save the labels to.
+    output_type : LabelOutputType
+    email : str, optional
+        The author to save the annotations of, used for GeoJSON output.
+    question : str, optional
+        The question to save the annotations for, used for GeoJSON output.
+    raw_file : TextIO, optional
+        The opened file to write raw annotations to. Required for raw output.
+    database : sqlite3.Connection, optional
+        The database to insert the annotations into, which has the `annotations` table. Required for SQLite output.
+
+    Returns
+    -------
+    Callable
+        Function taking the image and its annotations.
+    """
+    if output_type == LabelOutputType.JSON:
+
+        def save_json(image: Dict, annotations: List[SlideScoreResult]) -> None:
+            _save_label_as_json(save_dir, image["id"], image, annotations)
+
+        return save_json
+
+    if output_type == LabelOutputType.RAW:
+        if raw_file is None:
+            raise RuntimeError("Expected an open file to write the raw annotations to.")
+        write = raw_file.write
+
+        def save_raw(image: Dict, annotations: List[SlideScoreResult]) -> None:  # pylint: disable=unused-argument
+            write("".join(annotation.to_row() + "\n" for annotation in annotations))
+
+        return save_raw
+
+    if output_type == LabelOutputType.GEOJSON:
+        # pylint: disable=import-outside-toplevel
+        from slidescore_api.utils.annotations import SlideScoreAnnotations, save_shapely
+
+        def save_geojson(image: Dict, annotations: List[SlideScoreResult]) -> None:  # pylint: disable=unused-argument
             annotation_parser = SlideScoreAnnotations()
-            row_iterator = _row_iterator(annotations)
 
-            for curr_annotation in annotation_parser.from_iterable(
-                row_iterator, filter_author=email, filter_label=question
+            for curr_annotation in annotation_parser.from_results(
+                annotations, filter_author=email, filter_label=question
             ):
                 save_shapely(curr_annotation, save_dir=save_dir)
-        else:
-            raise RuntimeError(f"Output type {output_type} not supported.")
+
+        return save_geojson
+
+    if output_type == LabelOutputType.SQLITE:
+        if database is None:
+            raise RuntimeError("Expected an open database to insert the annotations into.")
+
+        def save_sqlite(image: Dict, annotations: List[SlideScoreResult]) -> None:  # pylint: disable=unused-argument
+            database.executemany(  # type: ignore
+                "INSERT INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        annotation.image_id,
+                        annotation.image_name,
+                        annotation.user,
+                        annotation.tma_row,
+                        annotation.tma_col,
+                        annotation.tma_sample_id,
+                        annotation.question,
+                        annotation.answer,
+                    )
+                    for annotation in annotations
+                ),
+            )
+
+        return save_sqlite
+
+    raise RuntimeError(f"Output type {output_type} not supported.")
 
 
 def _download_labels(args: argparse.Namespace) -> None:
@@ -339,26 +747,30 @@ def _download_labels(args: argparse.Namespace) -> None:
     None
     """
     build_cli_logger("download_labels", log_to_file=not args.no_log, verbosity_level=args.verbose)
-    api_token = parse_api_token(args.token_path)
     download_labels(
         args.slidescore_url,
-        api_token,
+        args.api_token,
         args.study_id,
         args.output_dir,
         output_type=args.output_type,
         question=args.question,
         email=args.user,
         disable_certificate_check=args.disable_certificate_check,
+        concurrency=args.concurrency,
+        cache_ttl=args.cache_ttl,
+        bulk=args.bulk,
+        client=args.client,
     )
 
 
-def append_to_manifest(save_dir: pathlib.Path, image_id: int, filename: pathlib.Path) -> None:
+def append_to_manifest(manifest: TextIO, image_id: int, filename: pathlib.Path) -> None:
     """
-    Create a manifest mapping image id to the filename.
+    Append a line mapping image id to the filename to the manifest.
 
     Parameters
     ----------
-    save_dir : pathlib.Path
+    manifest : TextIO
+        The opened manifest file, `slidescore_mapping.txt` in the output directory.
     image_id : int
     filename : pathlib.Path
 
@@ -366,8 +778,33 @@ def append_to_manifest(save_dir: pathlib.Path, image_id: int, filename: pathlib.
     -------
     None
     """
-    with open(save_dir / "slidescore_mapping.txt", "a", encoding="utf-8") as file:
-        file.write(f"{image_id} {filename.name}\n")
+    manifest.write(f"{image_id} {filename.name}\n")
+
+
+def read_manifest(save_dir: pathlib.Path) -> Dict[int, str]:
+    """
+    Read the manifest mapping image id to the filename, as written by `append_to_manifest`.
+
+    Parameters
+    ----------
+    save_dir : pathlib.Path
+
+    Returns
+    -------
+    dict
+        The filename of every image id in the manifest. Empty if there is no manifest.
+    """
+    manifest_path = save_dir / "slidescore_mapping.txt"
+    if not manifest_path.is_file():
+        return {}
+
+    downloaded = {}
+    with open(manifest_path, "r", encoding="utf-8") as manifest:
+        for line in manifest:
+            image_id, _, filename = line.rstrip("\n").partition(" ")
+            if filename:
+                downloaded[int(image_id)] = filename
+    return downloaded
 
 
 def download_wsis(
@@ -377,6 +814,11 @@ def download_wsis(
     save_dir: pathlib.Path,
     disable_certificate_check: bool = False,
     regex: str = None,
+    concurrency: int = 4,
+    cache_ttl: float = 0,
+    force: bool = False,
+    chunk_size: Optional[int] = None,
+    client: Optional[APIClient] = None,
 ) -> None:
     """
     Download all WSIs for a given study from SlideScore
@@ -390,18 +832,34 @@ def download_wsis(
     disable_certificate_check : bool
     regex: str
         Regex to apply to the list of images in the given study
+    concurrency : int
+        Number of WSIs which are downloaded simultaneously.
+    cache_ttl : float
+        Seconds an image list cached on disk by a previous call can be reused. If 0, it is always requested.
+    force : bool
+        Download all WSIs again, also those which have been downloaded before.
+    chunk_size : int, optional
+        Size in bytes of the chunks in which WSIs are written to disk. Defaults to `DOWNLOAD_CHUNK_SIZE` (1 MiB).
+    client : APIClient, optional
+        The client to make the requests with. If not given, a client is built from the url, token and certificate check.
 
     Returns
     -------
     None
     """
+    # pylint: disable=import-outside-toplevel
+    from tqdm import tqdm
+
+    from slidescore_api.api import DOWNLOAD_CHUNK_SIZE, build_client
+
     logger.info("Will write to: %s", save_dir)
     # Set up client and directories
-    client = build_client(slidescore_url, api_token, disable_certificate_check)
-    save_dir.mkdir(exist_ok=True)
+    if client is None:
+        client = build_client(slidescore_url, api_token, disable_certificate_check)
+    save_dir.mkdir(parents=True, exist_ok=True)
 
     # Collect image metadata
-    images = client.get_images(study_id)
+    images = cached_get_images(client, study_id, ttl=cache_ttl)
 
     # This call doesn't have a regex filter and will return all images
     if regex is not None:
@@ -409,14 +867,50 @@ def download_wsis(
         images = [item for item in images if pattern.match(item["name"])]
 
     logger.info("Found %s images.", len(images))
-    # Download and save WSIs
-    for image in tqdm(images):
-        image_id = image["id"]
 
-        logger.info("Downloading image for id: %s", image_id)
-        filename = client.download_slide(study_id, image, save_dir=save_dir)
-        logger.info("Image with id %s has been saved to %s.", image_id, filename)
-        append_to_manifest(save_dir, image_id, filename)
+    # Slides in the manifest of a previous run have been downloaded completely, so skip them without a request.
+    if not force:
+        downloaded = read_manifest(save_dir)
+        num_images = len(images)
+        images = [
+            image
+            for image in images
+            if image["id"] not in downloaded or not (save_dir / str(image["id"]) / downloaded[image["id"]]).is_file()
+        ]
+        if len(images) < num_images:
+            logger.info("Skipping %s images which have already been downloaded.", num_images - len(images))
+
+    # Keep a connection open for every thread.
+    if concurrency > client.max_connections:
+        client.set_max_connections(concurrency)
+
+    if chunk_size is None:
+        chunk_size = DOWNLOAD_CHUNK_SIZE
+
+    def download(image: Dict) -> pathlib.Path:
+        logger.info("Downloading image for id: %s", image["id"])
+        # Several progress bars of simultaneous downloads would overwrite each other, so only show the one of a single
+        # download.
+        return client.download_slide(
+            study_id,
+            image,
+            save_dir=save_dir,
+            skip_if_exists=not force,
+            chunk_size=chunk_size,
+            show_progress=concurrency == 1,
+        )
+
+    # Download and save WSIs. The manifest is opened once and only written from this thread. Every WSI is added as soon
+    # as it has been downloaded, so an interruption does not lose the WSIs which finished before earlier ones.
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, open(
+        save_dir / "slidescore_mapping.txt", "a", encoding="utf-8", buffering=1
+    ) as manifest:
+        # Only submit as many WSIs as can be downloaded at once, so a failure or interruption does not leave queued
+        # downloads running after the manifest has been closed.
+        downloaded_wsis = _as_completed_bounded(executor, download, images, max_pending=concurrency)
+        for image, filename in tqdm(downloaded_wsis, total=len(images), **PROGRESS_BAR_KWARGS):
+            logger.info("Image with id %s has been saved to %s.", image["id"], filename)
+            append_to_manifest(manifest, image["id"], filename)
 
 
 def _download_wsi(args: argparse.Namespace):
@@ -432,14 +926,18 @@ def _download_wsi(args: argparse.Namespace):
     None
     """
     # build_cli_logger("download_wsis", log_to_file=not args.no_log, verbosity_level=args.verbose)
-    api_token = parse_api_token(args.token_path)
     download_wsis(
         args.slidescore_url,
-        api_token,
+        args.api_token,
         args.study_id,
         args.output_dir,
         disable_certificate_check=args.disable_certificate_check,
         regex=args.regex,
+        concurrency=args.concurrency,
+        cache_ttl=args.cache_ttl,
+        force=args.force,
+        chunk_size=args.download_chunk_size,
+        client=args.client,
     )
 
 
@@ -454,6 +952,23 @@ def register_parser(parser: argparse._SubParsersAction):
         help="Directory to save output too.",
     )
     download_wsi_parser.add_argument("--regex", default=None, help="Regex to apply to the list of images in the given study. For instance '^T' will only download images starting with a T.")
+    download_wsi_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of WSIs to download simultaneously.",
+    )
+    download_wsi_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Download all WSIs again. By default WSIs in the manifest of a previous run are skipped.",
+    )
+    download_wsi_parser.add_argument(
+        "--download-chunk-size",
+        type=int,
+        default=None,
+        help="Size in bytes of the chunks in which WSIs are written to disk. Defaults to 1 MiB.",
+    )
     download_wsi_parser.set_defaults(subcommand=_download_wsi)
 
     download_label_parser = parser.add_parser("download-labels", help="Download labels from SlideScore.")
@@ -478,7 +993,8 @@ def register_parser(parser: argparse._SubParsersAction):
         "-o",
         "--output-type",
         dest="output_type",
-        help="Type of output. GeoJSON is a compliant GeoJSON output.",
+        help="Type of output. GeoJSON is a compliant GeoJSON output. SQLite stores all annotations in a single "
+        "annotations.sqlite database, which is compact and fast to query for large studies.",
         type=str,
         choices=LabelOutputType.__members__,
         default="GEOJSON",
@@ -488,6 +1004,18 @@ def register_parser(parser: argparse._SubParsersAction):
         type=pathlib.Path,
         help="Directory to save output too.",
     )
+    download_label_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of images to request annotations for simultaneously.",
+    )
+    download_label_parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Request the annotations of all images in a single request. Faster for studies with many images with "
+        "few annotations. Falls back to a request per image if the server refuses.",
+    )
     download_label_parser.set_defaults(subcommand=_download_labels)
 
     upload_csv_parser = parser.add_parser("upload-labels-from-csv", help="Upload labels to SlideScore.")
@@ -524,6 +1052,12 @@ def register_parser(parser: argparse._SubParsersAction):
         "pertains to the upload and answer contains a list of annotations (e.g.: ellipse, rectangle, polygon) "
         "to be uploaded to SlideScore. See the documentation for some examples.",
     )
+    upload_csv_parser.add_argument(
+        "--upload-batch-size",
+        type=int,
+        default=UPLOAD_BATCH_SIZE,
+        help="Number of results which are uploaded per request.",
+    )
     upload_csv_parser.set_defaults(subcommand=_upload_labels_from_csv)
 
     upload_json_parser = parser.add_parser("upload-labels-from-geojson", help="Upload labels to SlideScore.")
@@ -557,6 +1091,12 @@ def register_parser(parser: argparse._SubParsersAction):
         required=True,
         help="GeoJSON object file",
     )
+    upload_json_parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=1,
+        help="Number of processes used to convert the GeoJSON features. Useful for large files.",
+    )
     upload_json_parser.set_defaults(subcommand=_upload_labels_from_geojson)
 
 
@@ -594,6 +1134,13 @@ def cli():
         help="Disable the certificate check.",
         action="store_true",
     )
+    slidescore_parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=0,
+        help="Seconds that image lists and study configurations cached in ~/.cache/slidescore are reused by later "
+        "runs. Disabled if 0.",
+    )
     slidescore_parser.add_argument(
         "--no-log",
         help="Disable logging.",
@@ -615,6 +1162,11 @@ def cli():
     register_parser(slidescore_subparsers)
 
     args = slidescore_parser.parse_args()
+    from slidescore_api.api import build_client  # pylint: disable=import-outside-toplevel
+
+    # Parse the token and set up the client once, so all subcommands share it.
+    args.api_token = parse_api_token(args.token_path)
+    args.client = build_client(args.slidescore_url, args.api_token, args.disable_certificate_check)
     args.subcommand(args)
 
 
@@ -11,6 +11,12 @@ from typing import Optional
 
 PathLike = typing.Union[str, os.PathLike]
 
+# Loggers of dependencies which are kept at WARNING level or above.
+NOISY_LOGGERS = ["urllib3"]
+
+# Handlers added by `setup_logging`, which are replaced when it is called again.
+_HANDLERS: typing.List[logging.Handler] = []
+
 
 def setup_logging(
     filename: Optional[pathlib.Path] = None,
@@ -43,6 +49,15 @@ def setup_logging(
 
     root = logging.getLogger("")
     root.setLevel(log_level)
+    # urllib3 logs every connection and request at DEBUG level, which floods the log when downloading many images.
+    for noisy_logger in NOISY_LOGGERS:
+        logging.getLogger(noisy_logger).setLevel(max(root.level, logging.WARNING))
+
+    # Remove the handlers of a previous call, otherwise every message would be written multiple times.
+    while _HANDLERS:
+        previous_handler = _HANDLERS.pop()
+        root.removeHandler(previous_handler)
+        previous_handler.close()
 
     if use_stdout:
         handler = logging.StreamHandler(sys.stdout)
@@ -50,6 +65,7 @@ def setup_logging(
         stdout_formatter = logging.Formatter(formatter_str)
         handler.setFormatter(stdout_formatter)
         root.addHandler(handler)
+        _HANDLERS.append(handler)
 
     if filename:
         filename.parent.mkdir(parents=True, exist_ok=True)
@@ -58,6 +74,7 @@ def setup_logging(
         formatter = logging.Formatter(formatter_str)
         filehandler.setFormatter(formatter)
         root.addHandler(filehandler)
+        _HANDLERS.append(filehandler)
 
 
 def build_cli_logger(
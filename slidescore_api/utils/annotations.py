@@ -3,27 +3,41 @@
 
 import json
 import logging
+import math
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from enum import Enum
+from functools import partial
+from itertools import chain, islice
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, NamedTuple, TypedDict, Union
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, NamedTuple, Optional, TextIO, Tuple, Union
 
 import numpy as np
+import shapely
 import shapely.errors
-import shapely.validation
-from shapely.geometry import MultiPoint, MultiPolygon, Point, Polygon, box, mapping
+from shapely.geometry import MultiPolygon, Point, Polygon, box
+
+if TYPE_CHECKING:
+    from slidescore_api.api import SlideScoreResult
 
 logger = logging.getLogger(__name__)
 
+# Column indices of the rows of an annotation file, in the order of `SlideScoreAnnotations._headers`.
+_IMAGE_ID, _IMAGE_NAME, _BY, _QUESTION, _ANSWER, _LAST_MODIFIED_ON = range(6)
 
-class GeoJsonDict(TypedDict):
-    """
-    TypedDict for standard GeoJSON output
-    """
+# Number of rows of an annotation file parsed per task by `SlideScoreAnnotations.from_file`.
+PARSE_BATCH_SIZE = 256
 
-    type: str
-    lastModifiedOn: str
-    features: List[Any]
+# Number of geometries serialized at once when writing GeoJSON.
+GEOJSON_WRITE_BATCH_SIZE = 1000
+
+# Templates of the saved GeoJSON. The geometries are inserted as serialized by `shapely.to_geojson`.
+_FEATURE_COLLECTION_PREFIX = '{"type":"FeatureCollection","lastModifiedOn":%s,"features":['
+_FEATURE_COLLECTION_SUFFIX = "]}"
+_FEATURE_TEMPLATE = '{"id":"%d","type":"Feature","properties":%s,"geometry":%s}'
+_COMPACT_SEPARATORS = (",", ":")
 
 
 class ImageAnnotation(NamedTuple):
@@ -57,43 +71,51 @@ class AnnotationType(Enum):
     POINTS: str = "points"
 
 
-def _to_geojson_format(list_of_points: list, last_modified_on: str, label: str) -> GeoJsonDict:
+# Annotation types which can be saved as GeoJSON, as strings so the type of an annotation needs no enum lookup.
+_SAVED_TYPES = frozenset(
+    annotation_type.value
+    for annotation_type in (AnnotationType.POLYGON, AnnotationType.BRUSH, AnnotationType.RECT, AnnotationType.POINTS)
+)
+
+# Geometry type ids of shapely.Polygon and shapely.MultiPolygon, as returned by `shapely.get_type_id`.
+_POLYGON_TYPE_IDS = [shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON]
+
+
+def _write_geojson(file: TextIO, list_of_points: Union[list, np.ndarray], last_modified_on: str, label: str) -> None:
     """
-    Convert a given list of annotations into the GeoJSON standard.
+    Write a given list of annotations to a file in the GeoJSON standard.
+
+    The features are streamed to the file in batches, so the serialized FeatureCollection is never held in memory as a
+    whole. The geometries of a batch are serialized together by `shapely.to_geojson`.
 
     Parameters
     ----------
-    list_of_points: list
+    file: TextIO
+        The file to write the FeatureCollection to.
+    list_of_points: list or np.ndarray
         A list containing annotation shapes or coordinates.
+    last_modified_on: str
+        The time the annotation was last modified.
     label: str
         The string identifying the annotation class.
-    """
 
-    feature_collection: GeoJsonDict = {
-        "type": "FeatureCollection",
-        "lastModifiedOn": last_modified_on,
-        "features": [],
-    }
-
-    features: List[Any] = []
-    properties: Dict[str, Union[str, Dict[str, str]]] = {
-        "object_type": "annotation",
-        "classification": {
-            "name": label,
-        },
-    }
-    for index, data in enumerate(list_of_points):
-        geometry = mapping(data)
-        features.append(
-            {
-                "id": str(index),
-                "type": "Feature",
-                "properties": properties,
-                "geometry": geometry,
-            }
+    Returns
+    -------
+    None
+    """
+    properties = json.dumps(
+        {"object_type": "annotation", "classification": {"name": label}}, separators=_COMPACT_SEPARATORS
+    )
+    geometries = np.asarray(list_of_points, dtype=object)
+    file.write(_FEATURE_COLLECTION_PREFIX % json.dumps(last_modified_on))
+    for start in range(0, len(geometries), GEOJSON_WRITE_BATCH_SIZE):
+        if start > 0:
+            file.write(",")
+        batch = shapely.to_geojson(geometries[start : start + GEOJSON_WRITE_BATCH_SIZE]).tolist()
+        file.write(
+            ",".join(_FEATURE_TEMPLATE % (index, properties, geometry) for index, geometry in enumerate(batch, start))
         )
-    feature_collection["features"] = features
-    return feature_collection
+    file.write(_FEATURE_COLLECTION_SUFFIX)
 
 
 def save_shapely(annotations: ImageAnnotation, save_dir: Path) -> None:  # pylint:disable=logging-fstring-interpolation
@@ -115,28 +137,75 @@ def save_shapely(annotations: ImageAnnotation, save_dir: Path) -> None:  # pylin
     save_path.mkdir(parents=True, exist_ok=True)
     with open(save_path / (annotations.label + ".json"), "w", encoding="utf-8") as file:
         dump_list: list = []
-        for ann_id, _ in enumerate(annotations.annotation):
+        for annotation in annotations.annotation.values():
             # rects are internally polygons
-            annotation_type = AnnotationType[annotations.annotation[ann_id]["type"].upper()]
-            is_polygon = annotation_type in (
-                AnnotationType.POLYGON,
-                AnnotationType.BRUSH,
-                AnnotationType.RECT,
-            )
-            if not is_polygon and annotation_type != AnnotationType.POINTS:
+            annotation_type = annotation["type"]
+            if annotation_type not in _SAVED_TYPES:
                 raise RuntimeError(f"Annotation type {annotation_type} is not supported.")
-
-            coords = annotations.annotation[ann_id]["points"]
-            if isinstance(coords, (Polygon, MultiPolygon)) and coords.area == 0:
-                logger.warning(
-                    f"Dismissed polygon for {annotations.author} and {annotations.slide_name} because area = 0."
-                )
-                continue
-            dump_list.append(coords)
-        feature_collection = _to_geojson_format(
-            dump_list, last_modified_on=annotations.lastModifiedOn, label=annotations.label
+            if annotation_type == AnnotationType.POINTS.value:
+                dump_list.append(shapely.multipoints(annotation["points"]))
+            else:
+                dump_list.append(annotation["points"])
+
+        # Compute the areas of all shapes at once, to dismiss polygons without area.
+        geometries = np.asarray(dump_list, dtype=object)
+        dismissed = np.isin(shapely.get_type_id(geometries), _POLYGON_TYPE_IDS) & (shapely.area(geometries) == 0)
+        for _ in range(np.count_nonzero(dismissed)):
+            logger.warning(
+                f"Dismissed polygon for {annotations.author} and {annotations.slide_name} because area = 0."
+            )
+        _write_geojson(
+            file, geometries[~dismissed], last_modified_on=annotations.lastModifiedOn, label=annotations.label
         )
-        json.dump(feature_collection, file, indent=2)
+
+
+# Getter for the coordinates of a SlideScore point dictionary.
+_get_xy = itemgetter("x", "y")
+
+
+def _to_coordinates(points: List[Dict]) -> np.ndarray:
+    """
+    Convert a list of SlideScore points, dictionaries with keys "x" and "y", to an (N, 2) float32 array.
+
+    The coordinates are read in a single pass with `np.fromiter`, which avoids building a list per point.
+
+    Parameters
+    ----------
+    points : list
+
+    Returns
+    -------
+    np.ndarray
+    """
+    return np.fromiter(chain.from_iterable(map(_get_xy, points)), dtype=np.float32, count=2 * len(points)).reshape(
+        -1, 2
+    )
+
+
+def _to_polygons(polygons: List[List[Dict]]) -> np.ndarray:
+    """
+    Convert a list of SlideScore polygons, each a list of points, to an array of shapely Polygons.
+
+    All rings are constructed in a single call to `shapely.linearrings` on the concatenated coordinates. Polygons
+    without points become empty polygons.
+
+    Parameters
+    ----------
+    polygons : list
+
+    Returns
+    -------
+    np.ndarray
+        One-dimensional object array of shapely.geometry.Polygon.
+    """
+    lengths = np.fromiter(map(len, polygons), dtype=np.intp, count=len(polygons))
+    non_empty = lengths > 0
+    rings = np.empty(len(polygons), dtype=object)
+    if non_empty.any():
+        coordinates = _to_coordinates(list(chain.from_iterable(polygons)))
+        indices = np.repeat(np.arange(np.count_nonzero(non_empty)), lengths[non_empty])
+        rings[non_empty] = shapely.linearrings(coordinates, indices=indices)
+    return shapely.polygons(rings)
 
 
 def _parse_brush_annotation(annotations: Dict) -> Dict:  # pylint:disable=logging-fstring-interpolation
@@ -151,30 +220,29 @@ def _parse_brush_annotation(annotations: Dict) -> Dict:  # pylint:disable=loggin
     dict
         Dictionary with key type: "brush" and "points" a shapely.geometry.MultiplePolygon
     """
-    positive_polygons = annotations["positivePolygons"]
-    negative_polygons = annotations["negativePolygons"]
-    positive_polygons = {
-        k: Polygon(np.array([[pt["x"], pt["y"]] for pt in polygon], dtype=np.float32))
-        for k, polygon in enumerate(positive_polygons)
-    }
-    negative_polygons = {
-        k: Polygon(np.array([[pt["x"], pt["y"]] for pt in polygon], dtype=np.float32))
-        for k, polygon in enumerate(negative_polygons)
-    }
+    positive_polygons = _to_polygons(annotations["positivePolygons"])
+    negative_polygons = _to_polygons(annotations["negativePolygons"])
+    valid_negatives = negative_polygons.copy()
+    invalid = ~shapely.is_valid(valid_negatives)
+    if invalid.any():
+        valid_negatives[invalid] = shapely.make_valid(valid_negatives[invalid])
+
+    # Every negative polygon is a hole in the first positive polygon that contains it. The spatial index only runs the
+    # containment test on positive polygons whose bounding box contains the negative polygon.
+    tree = shapely.STRtree(positive_polygons)
+    negative_indices, positive_indices = tree.query(valid_negatives, predicate="within")
+    order = np.lexsort((positive_indices, negative_indices))
+    negative_indices, first = np.unique(negative_indices[order], return_index=True)
+    inners_per_polygon: List[List[Any]] = [[] for _ in positive_polygons]
+    for n_idx, p_idx in zip(negative_indices, positive_indices[order][first]):
+        inners_per_polygon[p_idx].append(valid_negatives[n_idx])
+    used = np.zeros(len(negative_polygons), dtype=bool)
+    used[negative_indices] = True
+    used_negatives = dict(enumerate(used))
 
-    used_negatives = {idx: False for idx in negative_polygons}
     inners_count = 0
     polygons = []
-    for p_poly in positive_polygons.values():
-        inners = []
-        for idx, n_poly in negative_polygons.items():
-            if not used_negatives[idx]:
-                if not n_poly.is_valid:
-                    n_poly = shapely.validation.make_valid(n_poly)
-                if n_poly.within(p_poly):
-                    inners.append(n_poly)
-                    used_negatives[idx] = True
-
+    for p_poly, inners in zip(positive_polygons, inners_per_polygon):
         inners_count += len(inners)
         polygon = Polygon(p_poly, inners)
         polygons.append(polygon)
@@ -211,7 +279,7 @@ def _parse_polygon_annotation(annotations: Dict) -> Dict:  # pylint:disable=logg
         Dictionary with key type: "brush" and "points" a shapely.geometry.MultiplePolygon
     """
     # returns points: MultiPolygon
-    points: Any = np.array([[pt["x"], pt["y"]] for pt in annotations["points"]], dtype=np.float32)
+    points: Any = _to_coordinates(annotations["points"])
     if len(points) < 3:
         logger.warning(f"Invalid polygon: {annotations}")
         points = []
@@ -245,13 +313,19 @@ def _parse_ellipse_annotation(annotations: Dict) -> Dict:
 
 def _parse_rect_annotation(annotations: Dict) -> Dict:
     # returns corner: Point, size: Point
-    corner = np.array([annotations["corner"]["x"], annotations["corner"]["y"]], dtype=np.float32)
-    size = np.array([annotations["size"]["x"], annotations["size"]["y"]], dtype=np.float32)
-
-    if np.isnan([np.asarray([corner, size])]).any():  # there are invalid rects, skip them
+    values = (
+        annotations["corner"]["x"],
+        annotations["corner"]["y"],
+        annotations["size"]["x"],
+        annotations["size"]["y"],
+    )
+
+    if any(value is None or math.isnan(value) for value in values):  # there are invalid rects, skip them
         logger.warning(f"Invalid polygon: {annotations}")
         points = []
     else:
+        corner = np.array(values[:2], dtype=np.float32)
+        size = np.array(values[2:], dtype=np.float32)
         points = box(*corner, *(corner + size), ccw=True)
 
     data = {
@@ -261,12 +335,12 @@ def _parse_rect_annotation(annotations: Dict) -> Dict:
     return data
 
 
-def _parse_points_annotation(annotations: Dict) -> Dict:
-    # returns points: MultiPoint
-    points = np.array([[_ann["x"], _ann["y"]] for _ann in annotations], dtype=np.float32)
+def _parse_points_annotation(annotations: List[Dict]) -> Dict:
+    # returns points: (N, 2) float32 ndarray, only converted to a MultiPoint when saved
+    points = _to_coordinates(annotations)
     data = {
         "type": "points",
-        "points": MultiPoint(points),
+        "points": points,
     }
     return data
 
@@ -277,7 +351,7 @@ class SlideScoreAnnotations:
     """
 
     _headers = ["ImageID", "Image Name", "By", "Question", "Answer", "lastModifiedOn"]
-    _parse_fns = {
+    _parse_fns: Dict[str, Callable[[Any], Dict]] = {
         "brush": _parse_brush_annotation,
         "ellipse": _parse_ellipse_annotation,
         "polygon": _parse_polygon_annotation,
@@ -332,11 +406,23 @@ class SlideScoreAnnotations:
                 self._row_iterator = line
                 yield self._row_iterator
 
-    def _parse_annotation_row(self, row, filter_empty):  # pylint:disable=too-many-branches
-        _row = dict(zip(self._headers, row.split("\t")))
+    def _parse_annotation_row(self, row, filter_empty):
+        _row = row.split("\t")
+        data = self._parse_answer(_row[_ANSWER], filter_empty)
+        if data is None:
+            return None
+        return _row, data
+
+    def _parse_answer(self, answer: str, filter_empty: bool) -> Optional[Dict]:  # pylint:disable=too-many-branches
+        # Empty answers and answers which are not a JSON list (comments) are recognized without decoding them.
+        if not answer or answer == "[]":
+            return None if filter_empty else {}
+        if not answer.lstrip().startswith("["):
+            return {0: {"type": "comment", "text": answer}}
+
         data = {}
         try:
-            ann = json.loads(_row["Answer"])
+            ann = json.loads(answer)
             if len(ann) > 0:
                 # Points dont have type, only x,y; so we use that to distinguish task
                 # Code can be shortened, but is more readable this way
@@ -347,10 +433,11 @@ class SlideScoreAnnotations:
 
                 # Segmentation - Treat brush, polygon as MultiPolygon
                 if label_type == "segmentation":
+                    parse_fns = self._parse_fns
                     for idx, _ann in enumerate(ann):
-                        data[idx] = self._parse_fns[_ann["type"]](_ann)
+                        data[idx] = parse_fns[_ann["type"]](_ann)
 
-                # Detection - Treat points as MultiPoint
+                # Detection - Treat points as an array of coordinates
                 elif label_type == "detection":
                     data[0] = self._parse_fns["points"](ann)
 
@@ -361,12 +448,22 @@ class SlideScoreAnnotations:
                 return None
 
         except json.decoder.JSONDecodeError:
-            if len(_row["Answer"]) > 0:
-                data = {0: {"type": "comment", "text": _row["Answer"]}}
+            if len(answer) > 0:
+                data = {0: {"type": "comment", "text": answer}}
             elif filter_empty:
                 return None
 
-        return _row, data
+        return data
+
+    def _filter_annotation(
+        self, row_annotation: ImageAnnotation, filter_author: Optional[str], filter_label: Optional[str]
+    ) -> bool:
+        if filter_author is not None or filter_label is not None:
+            if row_annotation.author != filter_author or row_annotation.label != filter_label:
+                self.unannotated += 1
+                return False
+        self.annotations_generated += 1
+        return True
 
     @property
     def annotated_images_list(self) -> list:
@@ -403,6 +500,7 @@ class SlideScoreAnnotations:
             brush: type (str), positive_polygons (ndarray) , negative_polygons (ndarray)
             polygon: type (str), points (ndarray)
             ellipse: type (str), center (ndarray) , size (ndarray)
+            points: type (str), points (ndarray of shape (N, 2))
         Empty rows have empty dict as data.
 
         Parameters
@@ -421,25 +519,117 @@ class SlideScoreAnnotations:
         row_annotation: ImageAnnotation
             A named tuple containing the attributes and annotations of a single WSI.
         """
-        for row in row_iterator:
-            _return = self._parse_annotation_row(row, filter_empty=filter_empty)
+        parsed_rows = (self._parse_annotation_row(row, filter_empty=filter_empty) for row in row_iterator)
+        yield from self._to_image_annotations(parsed_rows, filter_author, filter_label)
+
+    def from_file(
+        self,
+        filename: Path,
+        filter_author: Optional[str] = None,
+        filter_label: Optional[str] = None,
+        filter_empty=True,
+        num_workers: Optional[int] = None,
+    ) -> Iterable:
+        """
+        Function to convert a manually downloaded slidescore annotation file to an iterable. This gives the same
+        annotations as `from_iterable` on `annotation_file_iterator`, but parses batches of rows in parallel processes.
+
+        Parameters
+        ----------
+        filename: Path
+            The path to the slidescore annotation file.
+        filter_author: str
+            Email-like string to look for annotations corresponding to a particular annotation author.
+        filter_label:
+            a string that indicates a label name in the slidescore study deemed necessary by the user.
+        filter_empty: bool
+            A binary flag to indicate whether or not empty rows must be filtered.
+        num_workers: int, optional
+            Number of processes parsing the rows, defaults to the number of processors. With 1, the rows are parsed in
+            this process.
+
+        Returns
+        -------
+        row_annotation: ImageAnnotation
+            A named tuple containing the attributes and annotations of a single WSI.
+        """
+        rows = self.annotation_file_iterator(filename)
+        batches = iter(lambda: list(islice(rows, PARSE_BATCH_SIZE)), [])
+        parse = partial(_parse_annotation_rows, filter_empty=filter_empty)
+        with ExitStack() as stack:
+            convert: Callable = map
+            if num_workers != 1:
+                convert = stack.enter_context(ProcessPoolExecutor(max_workers=num_workers)).map
+            parsed_rows = chain.from_iterable(convert(parse, batches))
+            yield from self._to_image_annotations(parsed_rows, filter_author, filter_label)
+
+    def _to_image_annotations(
+        self, parsed_rows: Iterable, filter_author: Optional[str], filter_label: Optional[str]
+    ) -> Iterable:
+        for _return in parsed_rows:
             if _return is None:
                 self.num_empty += 1
                 continue
             _row, data = _return
             row_annotation = ImageAnnotation(
-                ImageID=_row["ImageID"],
-                lastModifiedOn=_row.get("lastModifiedOn", None),
-                slide_name=_row["Image Name"],
-                author=_row["By"],
-                label=_row["Question"],
+                ImageID=_row[_IMAGE_ID],
+                lastModifiedOn=_row[_LAST_MODIFIED_ON] if len(_row) > _LAST_MODIFIED_ON else None,  # type: ignore
+                slide_name=_row[_IMAGE_NAME],
+                author=_row[_BY],
+                label=_row[_QUESTION],
+                annotation=data,
+            )
+
+            if self._filter_annotation(row_annotation, filter_author, filter_label):
+                yield row_annotation
+
+    def from_results(
+        self,
+        results: Iterable["SlideScoreResult"],
+        filter_author: Optional[str] = None,
+        filter_label: Optional[str] = None,
+        filter_empty=True,
+    ) -> Iterable:
+        """
+        Function to convert SlideScore results, as returned by `APIClient.get_results`, to an iterable. This gives the
+        same annotations as `from_iterable` on the rows of the results, without formatting and splitting these rows.
+
+        Parameters
+        ----------
+        results: Iterable
+            SlideScoreResult objects.
+        filter_empty: bool
+            A binary flag to indicate whether or not empty rows must be filtered.
+        filter_author: str
+            Email-like string to look for annotations corresponding to a particular annotation author.
+        filter_label:
+            a string that indicates a label name in the slidescore study deemed necessary by the user.
+
+        Returns
+        -------
+        row_annotation: ImageAnnotation
+            A named tuple containing the attributes and annotations of a single WSI.
+        """
+        for result in results:
+            data = self._parse_answer(str(result.answer), filter_empty=filter_empty)
+            if data is None:
+                self.num_empty += 1
+                continue
+            # As in the rows of `SlideScoreResult.to_row`, the modification time is not included.
+            row_annotation = ImageAnnotation(
+                ImageID=str(result.image_id),
+                lastModifiedOn=None,  # type: ignore
+                slide_name=result.image_name,
+                author=result.user,
+                label=result.question,
                 annotation=data,
             )
 
-            if filter_author is not None or filter_label is not None:
-                if row_annotation.author != filter_author or row_annotation.label != filter_label:
-                    self.unannotated += 1
-                    continue
-            self.annotations_generated += 1
+            if self._filter_annotation(row_annotation, filter_author, filter_label):
+                yield row_annotation
+
 
-            yield row_annotation
+def _parse_annotation_rows(rows: List[str], filter_empty: bool) -> List[Optional[Tuple[List[str], Dict]]]:
+    """Parse a batch of rows of a slidescore annotation file, as done by `SlideScoreAnnotations.from_file`."""
+    parser = SlideScoreAnnotations()
+    return [parser._parse_annotation_row(row, filter_empty) for row in rows]  # pylint: disable=protected-access
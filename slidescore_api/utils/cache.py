@@ -0,0 +1,88 @@
+# coding=utf-8
+"""Utility file to cache SlideScore API responses on disk, so repeated CLI invocations can skip the request."""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
+
+if TYPE_CHECKING:
+    from slidescore_api.api import APIClient
+
+logger = logging.getLogger(__name__)
+
+# Directory where the cached responses are stored.
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "slidescore"
+
+
+def _cache_path(client: APIClient, endpoint: str, study_id: int) -> Path:
+    # Responses depend on the permissions of the token, so the server and token are part of the key. Only a hash of the
+    # token is stored.
+    key = hashlib.sha256(f"{client.server}\0{client.api_token}".encode("utf-8")).hexdigest()[:16]
+    return CACHE_DIR / f"{endpoint}_{study_id}_{key}.json"
+
+
+def _cached_call(path: Path, ttl: float, fetch: Callable[[], Any]) -> Any:
+    try:
+        if time.time() - path.stat().st_mtime < ttl:
+            logger.debug("Using cached response %s.", path)
+            return json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        pass
+
+    data = fetch()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so concurrent invocations never read a partially written file.
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, path)
+    except OSError as exception:
+        logger.warning("Could not cache response to %s: %s", path, exception)
+    return data
+
+
+def cached_get_images(client: APIClient, study_id: int, ttl: float = 3600) -> List[Dict]:
+    """
+    Get the images in the study, reusing a response cached on disk if it is younger than `ttl` seconds.
+
+    Parameters
+    ----------
+    client : APIClient
+    study_id : int
+    ttl : float
+        Maximum age of the cached response in seconds. If not positive, the cache is bypassed.
+
+    Returns
+    -------
+    list
+        The images in the study, as returned by `APIClient.get_images`.
+    """
+    if ttl <= 0:
+        return client.get_images(study_id)  # type: ignore
+    return _cached_call(_cache_path(client, "images", study_id), ttl, lambda: client.get_images(study_id))
+
+
+def cached_get_config(client: APIClient, study_id: int, ttl: float = 3600) -> Dict:
+    """
+    Get the configuration of the study, reusing a response cached on disk if it is younger than `ttl` seconds.
+
+    Parameters
+    ----------
+    client : APIClient
+    study_id : int
+    ttl : float
+        Maximum age of the cached response in seconds. If not positive, the cache is bypassed.
+
+    Returns
+    -------
+    dict
+        The configuration of the study, as returned by `APIClient.get_config`.
+    """
+    if ttl <= 0:
+        return client.get_config(study_id)
+    return _cached_call(_cache_path(client, "config", study_id), ttl, lambda: client.get_config(study_id))
@@ -0,0 +1,168 @@
+# coding=utf-8
+"""Tests for parsing SlideScore annotations."""
+import json
+
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import MultiPolygon, Polygon
+
+from slidescore_api.api import SlideScoreResult
+from slidescore_api.utils.annotations import SlideScoreAnnotations, _parse_brush_annotation
+
+HEADER = "ImageID\tImage Name\tBy\tQuestion\tAnswer\tlastModifiedOn"
+
+
+def _points(coordinates):
+    return [{"x": int(x_coord), "y": int(y_coord)} for x_coord, y_coord in coordinates]
+
+
+def _square(x_coord, y_coord, size):
+    return _points(
+        [(x_coord, y_coord), (x_coord + size, y_coord), (x_coord + size, y_coord + size), (x_coord, y_coord + size)]
+    )
+
+
+def _reference_parse_brush_annotation(annotations):
+    """
+    The brush parser before the spatial index was added, which tests every negative against every positive. Also
+    returns the holes assigned to each positive polygon.
+    """
+    positive_polygons = {
+        k: Polygon([(p["x"], p["y"]) for p in polygon]) for k, polygon in enumerate(annotations["positivePolygons"])
+    }
+    negative_polygons = {
+        k: Polygon([(p["x"], p["y"]) for p in polygon]) for k, polygon in enumerate(annotations["negativePolygons"])
+    }
+    used_negatives = {idx: False for idx in negative_polygons}
+    polygons = []
+    holes = []
+    for p_poly in positive_polygons.values():
+        inners = []
+        for idx, n_poly in negative_polygons.items():
+            if not used_negatives[idx]:
+                if not n_poly.is_valid:
+                    n_poly = shapely.make_valid(n_poly)
+                if n_poly.within(p_poly):
+                    inners.append(n_poly)
+                    used_negatives[idx] = True
+        polygons.append(Polygon(p_poly, inners))
+        holes.append([inner.wkb for inner in inners])
+    return Polygon(polygons[0]) if len(polygons) == 1 else MultiPolygon(polygons), holes
+
+
+def _random_brush(rng):
+    # Overlapping positives test that a hole goes to the first positive containing it. Some negatives lie outside all
+    # positives or straddle their boundary, and some are self-intersecting bowties which need to be made valid.
+    positives = [_square(*rng.integers(0, 500, size=2), rng.integers(50, 300)) for _ in range(rng.integers(1, 6))]
+    negatives = []
+    for _ in range(rng.integers(0, 15)):
+        x_coord, y_coord = rng.integers(0, 700, size=2)
+        size = rng.integers(2, 40)
+        if rng.random() < 0.2:
+            negatives.append(
+                _points(
+                    [
+                        (x_coord, y_coord),
+                        (x_coord + size, y_coord + size),
+                        (x_coord + size, y_coord),
+                        (x_coord, y_coord + size),
+                    ]
+                )
+            )
+        else:
+            negatives.append(_square(x_coord, y_coord, size))
+    return {"type": "brush", "positivePolygons": positives, "negativePolygons": negatives}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_parse_brush_annotation_matches_reference(mocker, seed):
+    brush = _random_brush(np.random.default_rng(seed))
+    expected, expected_holes = _reference_parse_brush_annotation(brush)
+    # Polygon(polygon, holes) returns the polygon itself, so the holes only show up in the calls to Polygon.
+    polygon = mocker.patch("slidescore_api.utils.annotations.Polygon", wraps=Polygon)
+
+    assert _parse_brush_annotation(brush)["points"].wkb == expected.wkb
+    holes = [[inner.wkb for inner in call.args[1]] for call in polygon.call_args_list if len(call.args) == 2]
+    assert holes == expected_holes
+
+
+def _answers():
+    brush = _random_brush(np.random.default_rng(0))
+    polygon = {"type": "polygon", "points": _square(0, 0, 10)}
+    ellipse = {"type": "ellipse", "center": {"x": 5, "y": 5}, "size": {"x": 2, "y": 3}}
+    rect = {"type": "rect", "corner": {"x": 1, "y": 2}, "size": {"x": 3, "y": 4}}
+    return [
+        json.dumps([brush, polygon]),
+        json.dumps([ellipse, rect]),
+        json.dumps(_points([(1, 2), (3, 4), (5, 6)])),
+        "looks fine",
+        "[]",
+        "",
+    ]
+
+
+def _normalize(annotation):
+    """Make the parsed data of an ImageAnnotation comparable, the geometries and arrays do not compare with ==."""
+    data = {}
+    for idx, value in annotation.annotation.items():
+        data[idx] = {
+            key: (
+                item.wkb
+                if isinstance(item, shapely.Geometry)
+                else np.asarray(item).tolist() if key != "type" else item
+            )
+            for key, item in value.items()
+        }
+    return annotation._replace(annotation=data)
+
+
+def _counters(parser):
+    return parser.annotations_generated, parser.unannotated, parser.num_empty
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+@pytest.mark.parametrize("filter_empty", [True, False])
+def test_from_file_matches_from_iterable(tmp_path, num_workers, filter_empty):
+    rows = [
+        f"{idx}\timage{idx}.svs\t{user}\t{question}\t{answer}\t2022-01-01"
+        for idx in range(200)
+        for user in ("a@slidescore.test", "b@slidescore.test")
+        for question, answer in zip(("brush", "shapes", "points", "comment", "empty", "blank"), _answers())
+    ]
+    filename = tmp_path / "annotations.txt"
+    filename.write_text("\n".join([HEADER, *rows]) + "\n", encoding="utf-8")
+
+    expected_parser = SlideScoreAnnotations()
+    expected = list(
+        expected_parser.from_iterable(expected_parser.annotation_file_iterator(filename), filter_empty=filter_empty)
+    )
+    parser = SlideScoreAnnotations()
+    annotations = list(parser.from_file(filename, filter_empty=filter_empty, num_workers=num_workers))
+
+    assert len(expected) == len(rows) - (len(rows) // 3 if filter_empty else 0)
+    assert [_normalize(annotation) for annotation in annotations] == [
+        _normalize(annotation) for annotation in expected
+    ]
+    assert _counters(parser) == _counters(expected_parser)
+
+    filtered = list(SlideScoreAnnotations().from_file(filename, "a@slidescore.test", "brush", num_workers=num_workers))
+    assert [annotation.ImageID for annotation in filtered] == [str(idx) for idx in range(200)]
+
+
+def test_from_results_matches_from_iterable():
+    results = [
+        SlideScoreResult.from_values(idx, f"image{idx}.svs", "a@slidescore.test", f"question{question}", answer)
+        for idx in range(3)
+        for question, answer in enumerate(_answers())
+    ]
+
+    expected_parser = SlideScoreAnnotations()
+    expected = list(expected_parser.from_iterable(result.to_row() for result in results))
+    parser = SlideScoreAnnotations()
+    annotations = list(parser.from_results(results))
+
+    assert [_normalize(annotation) for annotation in annotations] == [
+        _normalize(annotation) for annotation in expected
+    ]
+    assert _counters(parser) == _counters(expected_parser) == (12, 0, 6)
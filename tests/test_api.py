@@ -0,0 +1,147 @@
+# coding=utf-8
+"""Tests for the SlideScore API client, with the HTTP session mocked."""
+import io
+import urllib.parse
+from typing import Optional
+
+import pytest
+from PIL import Image
+from requests import Response
+from urllib3 import HTTPResponse
+
+from slidescore_api.api import APIClient, SlideScoreResult
+
+SLIDE = b"0123456789"
+
+
+def _response(
+    status_code: int, content: bytes = b"", filename: str = "slide.svs", content_range: Optional[str] = None
+) -> Response:
+    response = Response()
+    response.status_code = status_code
+    response.url = "http://slidescore.test/Api/DownloadSlide"
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    if content_range is not None:
+        response.headers["Content-Range"] = content_range
+    response.raw = HTTPResponse(body=io.BytesIO(content), preload_content=False)
+    return response
+
+
+@pytest.fixture(name="client")
+def fixture_client():
+    with APIClient("http://slidescore.test/", "token") as client:
+        yield client
+
+
+@pytest.fixture(name="image_dir")
+def fixture_image_dir(tmp_path):
+    image_dir = tmp_path / "1"
+    image_dir.mkdir()
+    (image_dir / "slide.svs.partial").write_bytes(SLIDE[:4])
+    return image_dir
+
+
+def _download(client, save_dir):
+    return client.download_slide(1, {"id": 1, "fileSize": len(SLIDE)}, save_dir)
+
+
+def test_download_slide_resumes_partial_download(mocker, client, image_dir):
+    get = mocker.patch.object(
+        client._session, "get", return_value=_response(206, SLIDE[4:], content_range="bytes 4-9/10")
+    )
+    write_to = _download(client, image_dir.parent)
+
+    assert write_to.read_bytes() == SLIDE
+    assert not (image_dir / "slide.svs.partial").exists()
+    assert get.call_args.kwargs["headers"] == {"Range": "bytes=4-"}
+
+
+def test_download_slide_restarts_if_range_is_ignored(mocker, client, image_dir):
+    mocker.patch.object(client._session, "get", return_value=_response(200, SLIDE))
+    write_to = _download(client, image_dir.parent)
+
+    assert write_to.read_bytes() == SLIDE
+
+
+def test_download_slide_restarts_if_range_is_not_satisfiable(mocker, client, image_dir):
+    get = mocker.patch.object(client._session, "get", side_effect=[_response(416), _response(200, SLIDE)])
+    write_to = _download(client, image_dir.parent)
+
+    assert write_to.read_bytes() == SLIDE
+    assert [call.kwargs["headers"] for call in get.call_args_list] == [{"Range": "bytes=4-"}, None]
+
+
+@pytest.mark.parametrize(
+    "content_range, content", [(None, SLIDE[4:]), ("bytes 0-9/10", SLIDE), ("bytes 6-9/10", SLIDE[6:])]
+)
+def test_download_slide_restarts_if_range_does_not_start_at_offset(mocker, client, image_dir, content_range, content):
+    partial = _response(206, content, content_range=content_range)
+    get = mocker.patch.object(client._session, "get", side_effect=[partial, _response(200, SLIDE)])
+    write_to = _download(client, image_dir.parent)
+
+    assert write_to.read_bytes() == SLIDE
+    assert [call.kwargs["headers"] for call in get.call_args_list] == [{"Range": "bytes=4-"}, None]
+
+
+def test_download_slide_finalizes_complete_partial_download(mocker, client, image_dir):
+    (image_dir / "slide.svs.partial").write_bytes(SLIDE)
+    get = mocker.patch.object(client._session, "get")
+    write_to = _download(client, image_dir.parent)
+
+    assert write_to == image_dir / "slide.svs"
+    assert write_to.read_bytes() == SLIDE
+    get.assert_not_called()
+
+
+def test_download_slide_discards_oversized_partial_download(mocker, client, image_dir):
+    (image_dir / "slide.svs.partial").write_bytes(SLIDE + b"garbage")
+    get = mocker.patch.object(client._session, "get", return_value=_response(200, SLIDE))
+    write_to = _download(client, image_dir.parent)
+
+    assert write_to.read_bytes() == SLIDE
+    assert get.call_args.kwargs["headers"] is None
+
+
+def test_get_tile_does_not_send_api_token(mocker, client):
+    tile = io.BytesIO()
+    Image.new("RGB", (4, 4)).save(tile, format="JPEG")
+    send = mocker.patch.object(client._session, "send", return_value=_response(200, tile.getvalue()))
+    client.base_url, client.cookie = "http://tiles.slidescore.test/i/1/_files", "cookie"
+
+    assert client.get_tile(0, 0, 0).size == (4, 4)
+    request = send.call_args.args[0]
+    assert "Authorization" not in request.headers
+    assert request.headers["Cookie"] == "t=cookie"
+
+
+def test_get_tiles_keeps_order_and_sizes_connection_pool(mocker, client):
+    mocker.patch.object(client, "_fetch_tile", side_effect=lambda level, x_coord, y_coord: (level, x_coord, y_coord))
+    client.base_url = "http://tiles.slidescore.test/i/1/_files"
+    coords = [(x_coord, y_coord) for x_coord in range(8) for y_coord in range(8)]
+
+    assert client.get_tiles(3, coords, max_workers=32) == [(3, *coord) for coord in coords]
+    assert client.max_connections == 32
+    assert client._session.get_adapter("http://slidescore.test/")._pool_maxsize == 32
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_upload_results_encodes_form(mocker, client, chunked):
+    response = _response(200, b'{"success": true}')
+    send = mocker.patch.object(client._session, "send", return_value=response)
+    results = [
+        SlideScoreResult.from_values(1, "a b.svs", "user@slidescore.test", "q&a", "[]"),
+        SlideScoreResult.from_values(2, "c.svs", "user@slidescore.test", "q&a", "50%"),
+    ]
+
+    assert client.upload_results(7, iter(results), chunked=chunked)
+    request = send.call_args.args[0]
+    body = b"".join(request.body) if chunked else request.body
+    assert urllib.parse.parse_qs(body.decode("ascii")) == {
+        "studyid": ["7"],
+        "results": ["\n" + "\n".join(result.to_row() for result in results)],
+    }
+    if chunked:
+        assert request.headers["Transfer-Encoding"] == "chunked"
+    else:
+        assert request.headers["Content-Length"] == str(len(body))
+        assert "Transfer-Encoding" not in request.headers
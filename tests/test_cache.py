@@ -0,0 +1,61 @@
+# coding=utf-8
+"""Tests for caching SlideScore API responses on disk."""
+import os
+import time
+from unittest import mock
+
+import pytest
+
+from slidescore_api.utils import cache
+
+IMAGES = [{"id": 1, "name": "image1"}]
+
+
+@pytest.fixture(name="client")
+def fixture_client(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path)
+    client = mock.Mock(server="http://slidescore.test", api_token="token")
+    client.get_images.return_value = IMAGES
+    return client
+
+
+def test_cached_get_images_reuses_response(client):
+    assert cache.cached_get_images(client, 1) == IMAGES
+    assert cache.cached_get_images(client, 1) == IMAGES
+    assert client.get_images.call_count == 1
+
+    # Other studies and other tokens are cached separately.
+    cache.cached_get_images(client, 2)
+    client.api_token = "other-token"
+    cache.cached_get_images(client, 1)
+    assert client.get_images.call_count == 3
+
+
+def test_cached_get_images_without_ttl_bypasses_cache(client, tmp_path):
+    cache.cached_get_images(client, 1, ttl=0)
+    cache.cached_get_images(client, 1, ttl=0)
+
+    assert client.get_images.call_count == 2
+    assert not list(tmp_path.iterdir())
+
+
+def test_cached_get_images_refreshes_expired_response(client, tmp_path):
+    cache.cached_get_images(client, 1, ttl=60)
+    (path,) = tmp_path.iterdir()
+    expired = time.time() - 61
+    os.utime(path, (expired, expired))
+
+    client.get_images.return_value = IMAGES * 2
+    assert cache.cached_get_images(client, 1, ttl=60) == IMAGES * 2
+    assert client.get_images.call_count == 2
+    assert cache.cached_get_images(client, 1, ttl=60) == IMAGES * 2
+    assert client.get_images.call_count == 2
+
+
+def test_cached_get_images_refreshes_corrupt_response(client, tmp_path):
+    cache.cached_get_images(client, 1)
+    (path,) = tmp_path.iterdir()
+    path.write_text('[{"id": 1', encoding="utf-8")
+
+    assert cache.cached_get_images(client, 1) == IMAGES
+    assert client.get_images.call_count == 2
@@ -0,0 +1,195 @@
+# coding=utf-8
+"""Tests for the SlideScore CLI functions, with the API client mocked."""
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from unittest import mock
+
+import pytest
+import requests
+
+from slidescore_api.api import SlideScoreResult
+from slidescore_api.cli import _convert_features, _map_bounded, download_labels, download_wsis, read_manifest
+
+IMAGES = [{"id": idx, "studyID": 1, "name": f"image{idx}"} for idx in range(5)]
+
+
+def test_map_bounded_keeps_order_and_limits_pending_calls():
+    pulled = []
+
+    def items():
+        for item in range(20):
+            pulled.append(item)
+            yield item
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = _map_bounded(executor, lambda item: item * 2, items(), max_pending=3)
+        for consumed, result in enumerate(results, start=1):
+            assert result == 2 * (consumed - 1)
+            assert len(pulled) <= consumed + 3
+    assert pulled == list(range(20))
+
+
+def test_download_wsis_adds_finished_wsis_to_manifest_immediately(tmp_path):
+    images = [{"id": 0, "name": "slow"}, {"id": 1, "name": "fast"}]
+    manifest = tmp_path / "slidescore_mapping.txt"
+
+    def download_slide(study_id, image, save_dir, **kwargs):  # pylint: disable=unused-argument
+        assert not kwargs["show_progress"]
+        if image["id"] == 0:
+            # Only finish the first WSI once the second one has been added to the manifest.
+            deadline = time.monotonic() + 5
+            while "1 fast.svs" not in manifest.read_text(encoding="utf-8"):
+                assert time.monotonic() < deadline, "The finished WSI was not added to the manifest."
+                time.sleep(0.01)
+        return save_dir / str(image["id"]) / f"{image['name']}.svs"
+
+    client = mock.Mock(max_connections=20, download_slide=download_slide)
+    client.get_images.return_value = images
+    download_wsis("http://slidescore.test/", "token", 1, tmp_path, concurrency=2, client=client)
+
+    assert manifest.read_text(encoding="utf-8").splitlines() == ["1 fast.svs", "0 slow.svs"]
+
+
+def test_convert_features_drops_holes_with_warning(caplog):
+    exterior = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+    hole = [[2, 2], [4, 2], [4, 4], [2, 4], [2, 2]]
+    features = [
+        {
+            "id": "with-hole",
+            "geometry": {"type": "Polygon", "coordinates": [exterior, hole]},
+            "properties": {"classification": {"name": "tumor"}},
+        },
+        {
+            "id": "without-hole",
+            "geometry": {"type": "Polygon", "coordinates": [exterior]},
+            "properties": {"classification": {"name": "tumor"}},
+        },
+    ]
+
+    answers = _convert_features(features)
+
+    assert answers["tumor"][0] == answers["tumor"][1]
+    assert json.loads(answers["tumor"][0])["points"][:3] == [{"x": 0, "y": 0}, {"x": 10, "y": 0}, {"x": 10, "y": 10}]
+    assert [record.args[0] for record in caplog.records] == ["with-hole"]
+
+
+def test_convert_features_accepts_mixed_dimensions():
+    exterior = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+    features = [
+        {"geometry": {"type": "Polygon", "coordinates": [ring]}, "properties": {"classification": {"name": "tumor"}}}
+        for ring in (
+            exterior,
+            [[*point, 5] for point in exterior],
+            [[2 * x_coord, y_coord] for x_coord, y_coord in exterior],
+        )
+    ]
+
+    answers = _convert_features(features)
+
+    assert answers["tumor"][0] == answers["tumor"][1]
+    assert json.loads(answers["tumor"][2])["points"][1] == {"x": 20, "y": 0}
+
+
+def _results_client(images):
+    """Mock client which returns one polygon and one comment result per image."""
+    polygon = json.dumps([{"type": "polygon", "points": [{"x": 0, "y": 0}, {"x": 10, "y": 0}, {"x": 10, "y": 10}]}])
+
+    def get_results(study_id, imageid=None, **kwargs):  # pylint: disable=unused-argument
+        for image in images:
+            if imageid is None or imageid == image["id"]:
+                yield SlideScoreResult.from_values(image["id"], image["name"], "user", "tumor", polygon)
+                yield SlideScoreResult.from_values(image["id"], image["name"], "user", "comment", "looks fine")
+
+    client = mock.Mock(max_connections=20)
+    client.get_images.return_value = images
+    client.get_results.side_effect = get_results
+    return client
+
+
+def test_download_labels_sqlite(tmp_path):
+    download_labels("http://slidescore.test/", "token", 1, tmp_path, "SQLITE", client=_results_client(IMAGES))
+
+    with closing(sqlite3.connect(tmp_path / "annotations.sqlite")) as database:
+        rows = database.execute("SELECT image_id, image_name, question, answer FROM annotations").fetchall()
+    assert [row[:3] for row in rows] == [
+        (image["id"], image["name"], question) for image in IMAGES for question in ("tumor", "comment")
+    ]
+    assert rows[1][3] == "looks fine"
+
+
+@pytest.mark.parametrize(
+    "exception",
+    [requests.exceptions.HTTPError("403 Forbidden"), requests.exceptions.RetryError("Too many 504 error responses")],
+)
+def test_download_labels_bulk_falls_back_to_requests_per_image(tmp_path, exception):
+    client = _results_client(IMAGES)
+    get_results = client.get_results.side_effect
+
+    def refuse_bulk(study_id, imageid=None, **kwargs):
+        if imageid is None:
+            raise exception
+        return get_results(study_id, imageid=imageid, **kwargs)
+
+    client.get_results.side_effect = refuse_bulk
+    download_labels("http://slidescore.test/", "token", 1, tmp_path / "fallback", "RAW", bulk=True, client=client)
+    download_labels(
+        "http://slidescore.test/", "token", 1, tmp_path / "bulk", "RAW", bulk=True, client=_results_client(IMAGES)
+    )
+    download_labels("http://slidescore.test/", "token", 1, tmp_path / "single", "RAW", client=_results_client(IMAGES))
+
+    expected = (tmp_path / "single" / "annotations.txt").read_text(encoding="utf-8")
+    assert expected.count("\n") == 2 * len(IMAGES)
+    assert (tmp_path / "fallback" / "annotations.txt").read_text(encoding="utf-8") == expected
+    assert (tmp_path / "bulk" / "annotations.txt").read_text(encoding="utf-8") == expected
+    assert client.get_results.call_count == 1 + len(IMAGES)
+
+
+def _download_slide(study_id, image, save_dir, **kwargs):  # pylint: disable=unused-argument
+    filename = save_dir / str(image["id"]) / f"{image['name']}.svs"
+    filename.parent.mkdir(exist_ok=True)
+    filename.write_bytes(b"slide")
+    return filename
+
+
+def test_download_wsis_skips_wsis_in_manifest_unless_forced(tmp_path):
+    client = mock.Mock(max_connections=20)
+    client.get_images.return_value = IMAGES
+    client.download_slide.side_effect = _download_slide
+
+    download_wsis("http://slidescore.test/", "token", 1, tmp_path, client=client)
+    assert read_manifest(tmp_path) == {image["id"]: f"{image['name']}.svs" for image in IMAGES}
+    assert client.download_slide.call_count == len(IMAGES)
+
+    # A WSI which is in the manifest but missing on disk is downloaded again.
+    (tmp_path / "0" / "image0.svs").unlink()
+    client.download_slide.reset_mock()
+    download_wsis("http://slidescore.test/", "token", 1, tmp_path, client=client)
+    assert [call.args[1]["id"] for call in client.download_slide.call_args_list] == [0]
+
+    client.download_slide.reset_mock()
+    download_wsis("http://slidescore.test/", "token", 1, tmp_path, force=True, client=client)
+    assert client.download_slide.call_count == len(IMAGES)
+    assert all(not call.kwargs["skip_if_exists"] for call in client.download_slide.call_args_list)
+
+
+def test_download_wsis_stops_starting_downloads_after_failure(tmp_path):
+    started = []
+
+    def download_slide(study_id, image, save_dir, **kwargs):
+        started.append(image["id"])
+        if image["id"] == 0:
+            raise requests.exceptions.ConnectionError("Connection reset")
+        time.sleep(0.05)
+        return _download_slide(study_id, image, save_dir, **kwargs)
+
+    client = mock.Mock(max_connections=20, download_slide=download_slide)
+    client.get_images.return_value = IMAGES
+    with pytest.raises(requests.exceptions.ConnectionError):
+        download_wsis("http://slidescore.test/", "token", 1, tmp_path, concurrency=2, client=client)
+
+    # Only the first two WSIs can have been submitted, the second may have been cancelled before it started.
+    assert set(started) <= {0, 1}
+    assert not read_manifest(tmp_path)